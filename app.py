@@ -3,6 +3,7 @@ Intelligence DCET Quiz Generator
 Main Flask Application
 """
 
+import multiprocessing
 import os
 from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
@@ -13,6 +14,8 @@ from backend.routes.student_routes import student_bp
 from backend.routes.quiz_routes import quiz_bp
 from backend.routes.subject_routes import subject_bp
 from backend.routes.admin_routes import admin_bp
+from backend.services.ingestion_queue import ingestion_queue
+from backend.services.question_bank import question_bank
 
 
 def create_app():
@@ -98,9 +101,13 @@ def create_app():
 app = create_app()
 
 # Initialize DB ONCE at startup (Railway safe)
-with app.app_context():
-    init_db()
-    seed_initial_data()
+# PDF extraction processes re-import this module when run as a script; skip startup there
+if multiprocessing.parent_process() is None:
+    with app.app_context():
+        init_db()
+        seed_initial_data()
+        ingestion_queue.resume_pending()
+        question_bank.resume()
 
 
 # =====================================================
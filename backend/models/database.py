@@ -5,7 +5,7 @@ import enum
 from datetime import datetime
 
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Text,
+    create_engine, inspect, text, Column, Integer, String, Text,
     DateTime, Boolean, Float, ForeignKey
 )
 from sqlalchemy.orm import (
@@ -42,6 +42,12 @@ class UserRole(enum.Enum):
     STUDENT = "student"
     ADMIN = "admin"
 
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 # ======================================================
 # USER MODEL
 # ======================================================
@@ -119,6 +125,9 @@ class Unit(Base):
 # ======================================================
 class Document(Base):
     __tablename__ = "documents"
+    # Ids tag chunks and tombstones in the vector store, so SQLite must not
+    # hand a deleted document's id to a new upload
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True)
     unit_id = Column(Integer, ForeignKey("units.id", ondelete="CASCADE"))
@@ -130,10 +139,72 @@ class Document(Base):
     chunk_count = Column(Integer, default=0)
     is_processed = Column(Boolean, default=False)
 
+    # SHA-256 of the file bytes; re-uploads to the same unit link to the
+    # document that owns the chunks instead of being ingested again.
+    # Not a foreign key: the id tags the chunks in the vector store and must
+    # outlive the owner's row while links to it remain.
+    content_hash = Column(String(64), index=True)
+    source_document_id = Column(Integer, index=True)
+
     created_at = Column(DateTime, default=datetime.utcnow)
 
     unit = relationship("Unit", back_populates="documents")
 
+# ======================================================
+# INGESTION JOBS
+# ======================================================
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"))
+    subject_id = Column(Integer, ForeignKey("subjects.id"))
+    unit_id = Column(Integer, ForeignKey("units.id"))
+
+    status = Column(String(20), default=JobStatus.QUEUED.value, index=True)
+    # queued -> parsing <-> embedding -> done / failed
+    stage = Column(String(20), default="queued")
+
+    total_pages = Column(Integer, default=0)
+    pages_parsed = Column(Integer, default=0)
+    chunks_created = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    # Touched periodically while running; a running job whose worker died stops updating it
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    document = relationship("Document")
+
+# ======================================================
+# QUESTION BANK (PRE-GENERATED MCQS)
+# ======================================================
+class QuestionBank(Base):
+    __tablename__ = "question_bank"
+
+    id = Column(Integer, primary_key=True)
+    subject_id = Column(Integer, ForeignKey("subjects.id", ondelete="CASCADE"))
+    unit_id = Column(Integer, ForeignKey("units.id", ondelete="CASCADE"), index=True)
+    difficulty = Column(String(20), nullable=False, index=True)
+
+    # Hash of the normalised question text, to keep the bank free of repeats
+    question_key = Column(String(32), nullable=False)
+    question_data = Column(Text, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QuestionBankLease(Base):
+    """Which worker is refilling a bank, so workers don't refill the same one at once."""
+    __tablename__ = "question_bank_leases"
+
+    unit_id = Column(Integer, ForeignKey("units.id", ondelete="CASCADE"), primary_key=True)
+    difficulty = Column(String(20), primary_key=True)
+    holder = Column(String(64), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
 # ======================================================
 # QUIZ ATTEMPTS
 # ======================================================
@@ -206,6 +277,24 @@ class StudentPerformance(Base):
 # ======================================================
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def _add_missing_columns():
+    """create_all() never alters existing tables; add new nullable columns."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+                print(f"🧱 Added column {table.name}.{column.name}")
 
 def get_db():
     db = SessionLocal()
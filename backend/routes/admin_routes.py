@@ -4,13 +4,23 @@ Handles admin dashboard, subject/unit management, PDF upload, and analytics
 """
 import os
 import uuid
+import hashlib
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from functools import wraps
+from sqlalchemy import or_
 from werkzeug.utils import secure_filename
 from backend.services.auth_service import verify_token
 from backend.services.rag_service import rag_service
-from backend.models.database import SessionLocal, User, Subject, Unit, Document, QuizAttempt, FlashcardSession
+from backend.services.ingestion_queue import ingestion_queue, in_flight_filter, is_stale, job_to_dict
+from backend.services.context_assembler import context_assembler
+from backend.services.ai_service import llm_stats, coalescing_stats
+from backend.services.llm_pool import llm_pool, background_pool
+from backend.services.question_bank import question_bank
+from backend.models.database import (
+    SessionLocal, User, Subject, Unit, Document, QuizAttempt, FlashcardSession,
+    IngestionJob
+)
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -41,6 +51,14 @@ def require_admin(f):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def file_sha256(stream):
+    """SHA-256 of an upload stream, rewound afterwards so it can still be saved"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
 @admin_bp.route('/analytics', methods=['GET'])
 @require_admin
 def get_analytics():
@@ -261,6 +279,53 @@ def upload_document():
             return jsonify({"success": False, "message": "Subject or unit not found"}), 404
         
         original_filename = secure_filename(file.filename)
+        content_hash = file_sha256(file.stream)
+        
+        duplicate = db.query(Document).filter(
+            Document.unit_id == int(unit_id),
+            Document.content_hash == content_hash,
+            Document.is_processed == True
+        ).first()
+        
+        if duplicate:
+            # Same bytes already ingested for this unit: link, don't re-ingest
+            document = Document(
+                unit_id=int(unit_id),
+                filename=duplicate.filename,
+                original_filename=original_filename,
+                file_path=duplicate.file_path,
+                chunk_count=duplicate.chunk_count,
+                is_processed=True,
+                content_hash=content_hash,
+                source_document_id=duplicate.source_document_id or duplicate.id
+            )
+            db.add(document)
+            db.commit()
+            
+            return jsonify({
+                "success": True,
+                "message": f"Identical document already uploaded. Linked to its {duplicate.chunk_count} chunks.",
+                "document": {
+                    "id": document.id,
+                    "filename": original_filename,
+                    "chunk_count": duplicate.chunk_count,
+                    "duplicate_of": document.source_document_id
+                }
+            }), 201
+        
+        in_flight = db.query(IngestionJob).join(Document).filter(
+            Document.unit_id == int(unit_id),
+            Document.content_hash == content_hash,
+            in_flight_filter()
+        ).first()
+        
+        if in_flight:
+            return jsonify({
+                "success": True,
+                "message": "Identical document is already being processed.",
+                "job": job_to_dict(in_flight)
+            }), 202
+        
         unique_filename = f"{uuid.uuid4()}_{original_filename}"
         file_path = os.path.join(UPLOAD_DIR, unique_filename)
         
@@ -271,38 +336,61 @@ def upload_document():
             unit_id=int(unit_id),
             filename=unique_filename,
             original_filename=original_filename,
-            file_path=file_path
+            file_path=file_path,
+            content_hash=content_hash
         )
         db.add(document)
         db.flush()
         
-        chunk_count = rag_service.ingest_document(
-            file_path,
-            int(subject_id),
-            int(unit_id),
-            document.id
+        job = IngestionJob(
+            document_id=document.id,
+            subject_id=int(subject_id),
+            unit_id=int(unit_id)
         )
-        
-        document.chunk_count = chunk_count
-        document.is_processed = chunk_count > 0
-        
+        db.add(job)
         db.commit()
         
+        # Parsing, embedding and indexing happen off the request thread
+        ingestion_queue.submit(job.id)
+        
         return jsonify({
             "success": True,
-            "message": f"Document uploaded and processed. {chunk_count} chunks created.",
+            "message": "Document uploaded. Processing in the background.",
             "document": {
                 "id": document.id,
-                "filename": original_filename,
-                "chunk_count": chunk_count
-            }
-        }), 201
+                "filename": original_filename
+            },
+            "job": job_to_dict(job)
+        }), 202
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
     finally:
         db.close()
 
+@admin_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@require_admin
+def get_job(job_id):
+    """Get stage and progress of an ingestion job"""
+    db = SessionLocal()
+    try:
+        job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+        
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+        
+        if is_stale(job):
+            # Its worker died after this process started; fail it now
+            ingestion_queue.fail_stale()
+            db.refresh(job)
+        
+        return jsonify({
+            "success": True,
+            "job": job_to_dict(job)
+        }), 200
+    finally:
+        db.close()
+
 @admin_bp.route('/documents', methods=['GET'])
 @require_admin
 def get_documents():
@@ -346,18 +434,83 @@ def delete_document(doc_id):
         if not document:
             return jsonify({"success": False, "message": "Document not found"}), 404
         
-        if os.path.exists(document.file_path):
-            os.remove(document.file_path)
+        shared_file = db.query(Document).filter(
+            Document.file_path == document.file_path,
+            Document.id != document.id
+        ).count() > 0
+        
+        # Chunks are tagged with the owning upload's id; links share them
+        owner_id = document.source_document_id or document.id
+        still_linked = db.query(Document).filter(
+            or_(Document.id == owner_id, Document.source_document_id == owner_id),
+            Document.id != document.id
+        ).count() > 0
         
+        unit_id, subject_id = document.unit_id, document.unit.subject_id if document.unit else None
+        db.query(IngestionJob).filter(IngestionJob.document_id == document.id).delete()
         db.delete(document)
         db.commit()
         
+        hidden_chunks = 0
+        if not still_linked:
+            hidden_chunks = rag_service.delete_document(owner_id)
+        
+        if hidden_chunks:
+            # Banked questions may come from the removed material
+            question_bank.purge_unit(unit_id)
+            if subject_id:
+                question_bank.schedule_unit(subject_id, unit_id)
+        
+        if not shared_file and os.path.exists(document.file_path):
+            os.remove(document.file_path)
+        
         return jsonify({
             "success": True,
-            "message": "Document deleted successfully"
+            "message": "Document deleted successfully",
+            "chunks_removed": hidden_chunks
         }), 200
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
     finally:
         db.close()
+
+@admin_bp.route('/index/compact', methods=['POST'])
+@require_admin
+def compact_index():
+    """Drop deleted documents' chunks from the vector index"""
+    try:
+        stats = rag_service.compact_index()
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "message": f"Index compacted. {stats['dead_chunks_removed']} deleted chunks removed.",
+        "stats": stats
+    }), 200
+
+@admin_bp.route('/index/shards', methods=['GET'])
+@require_admin
+def get_shard_stats():
+    """Per-subject shard cache of this worker: loaded shards, hit/miss, load times"""
+    return jsonify({"success": True, "shards": rag_service.shard_stats()}), 200
+
+@admin_bp.route('/generation/stats', methods=['GET'])
+@require_admin
+def get_generation_stats():
+    """Context assembly, LLM call and request coalescing metrics of this worker"""
+    return jsonify({
+        "success": True,
+        "context": context_assembler.stats(),
+        "llm": llm_stats(),
+        "llm_pool": llm_pool.stats(),
+        "llm_background_pool": background_pool.stats(),
+        "coalescing": coalescing_stats()
+    }), 200
+
+@admin_bp.route('/question-bank', methods=['GET'])
+@require_admin
+def get_question_bank_stats():
+    """Banked questions per unit and difficulty, and this worker's refill rate"""
+    return jsonify({"success": True, "question_bank": question_bank.stats()}), 200
@@ -4,10 +4,10 @@ Handles quiz generation, submission, and flashcard operations
 """
 import json
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from functools import wraps
 from backend.services.auth_service import verify_token
-from backend.services.ai_service import generate_quiz, generate_flashcards
+from backend.services.ai_service import generate_quiz, generate_flashcards, stream_quiz
 from backend.models.database import SessionLocal, QuizAttempt, FlashcardSession, Subject, Unit
 
 quiz_bp = Blueprint('quiz', __name__, url_prefix='/quiz')
@@ -57,7 +57,7 @@ def generate_quiz_route():
             return jsonify({"success": False, "message": "Subject or unit not found"}), 404
         
         if mode == 'flashcard':
-            result = generate_flashcards(subject_id, unit_id, difficulty)
+            result = generate_flashcards(subject_id, unit_id, difficulty, user_id=request.user_id)
             
             if result["success"]:
                 session = FlashcardSession(
@@ -72,7 +72,7 @@ def generate_quiz_route():
                 
                 result["session_id"] = session.id
         else:
-            result = generate_quiz(subject_id, unit_id, difficulty)
+            result = generate_quiz(subject_id, unit_id, difficulty, user_id=request.user_id)
             
             if result["success"]:
                 attempt = QuizAttempt(
@@ -95,6 +95,99 @@ def generate_quiz_route():
     finally:
         db.close()
 
+def _sse(event, data):
+    """One Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _finalise_attempt(attempt_id, questions):
+    """Store the streamed questions; an attempt that got none is removed"""
+    db = SessionLocal()
+    try:
+        attempt = db.query(QuizAttempt).filter(QuizAttempt.id == attempt_id).first()
+        if attempt:
+            if questions:
+                attempt.total_questions = len(questions)
+                attempt.questions_data = json.dumps(questions)
+            else:
+                db.delete(attempt)
+            db.commit()
+    finally:
+        db.close()
+
+@quiz_bp.route('/generate/stream', methods=['POST'])
+@require_auth
+def generate_quiz_stream_route():
+    """Generate a quiz, sending each question as a Server-Sent Event as soon as it is ready"""
+    data = request.get_json()
+    
+    subject_id = data.get('subject_id')
+    unit_id = data.get('unit_id')
+    difficulty = data.get('difficulty', 'medium')
+    
+    if not subject_id or not unit_id:
+        return jsonify({"success": False, "message": "Subject and unit are required"}), 400
+    
+    if difficulty not in ['easy', 'medium', 'hard']:
+        difficulty = 'medium'
+    
+    db = SessionLocal()
+    try:
+        subject = db.query(Subject).filter(Subject.id == subject_id).first()
+        unit = db.query(Unit).filter(Unit.id == unit_id).first()
+        
+        if not subject or not unit:
+            return jsonify({"success": False, "message": "Subject or unit not found"}), 404
+        
+        result = stream_quiz(subject_id, unit_id, difficulty, user_id=request.user_id)
+        if not result["success"]:
+            return jsonify(result), 400
+        
+        # The attempt exists from the start so the client has its id;
+        # questions_data is written once the stream ends
+        attempt = QuizAttempt(
+            user_id=request.user_id,
+            subject_id=subject_id,
+            unit_id=unit_id,
+            difficulty=difficulty,
+            total_questions=result["total"],
+            questions_data="[]"
+        )
+        db.add(attempt)
+        db.commit()
+        
+        start = {
+            "attempt_id": attempt.id,
+            "difficulty": difficulty,
+            "total": result["total"],
+            "subject_name": subject.name,
+            "unit_name": unit.name
+        }
+    finally:
+        db.close()
+    
+    def events():
+        questions = []
+        try:
+            yield _sse("start", start)
+            for question in result["questions"]:
+                questions.append(question)
+                yield _sse("question", {"index": len(questions) - 1, "question": question})
+        finally:
+            # Also runs when the client disconnects mid-stream
+            result["questions"].close()
+            _finalise_attempt(start["attempt_id"], questions)
+        
+        if questions:
+            yield _sse("done", {"total": len(questions)})
+        else:
+            yield _sse("error", {"message": "Failed to generate quiz. Please try again."})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @quiz_bp.route('/submit', methods=['POST'])
 @require_auth
 def submit_quiz():
@@ -119,6 +212,8 @@ def submit_quiz():
             return jsonify({"success": False, "message": "Quiz attempt not found"}), 404
         
         questions = json.loads(attempt.questions_data)
+        if not questions:
+            return jsonify({"success": False, "message": "Quiz is still being generated"}), 409
         
         correct_count = 0
         results = []
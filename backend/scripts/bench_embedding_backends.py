@@ -0,0 +1,88 @@
+"""
+Benchmark: local vs remote embedding backend throughput
+
+Embeds the same synthetic chunks with the local hashed n-gram backend and
+with the OpenAI backend pointed at the stub server from bench_embeddings,
+then reports texts/s and a self-retrieval check for the local vectors: a
+sentence taken from a chunk should find that chunk first.
+
+Usage:
+    python -m backend.scripts.bench_embedding_backends --chunks 2000 --latency 0.15
+"""
+
+import argparse
+import os
+import random
+import time
+
+import faiss
+
+from backend.scripts.bench_embeddings import start_stub
+
+SYLLABLES = "ba ce di fo gu ha je ki lo mu na pe qi ro su ta ve wi xo yu za".split()
+
+
+def make_chunks(n: int, rng: random.Random):
+    """Workbook-like chunks over a Zipf-ish vocabulary of pseudo-words."""
+    vocab = [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(5000)
+    ]
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    return [
+        " ".join(rng.choices(vocab, weights, k=160)) + f". Chunk number {i}."
+        for i in range(n)
+    ]
+
+
+def throughput(name: str, backend, texts):
+    t0 = time.perf_counter()
+    vectors, ok = backend.embed(texts)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"  {name:<7} {elapsed:7.2f}s  {len(texts) / elapsed:9.1f} texts/s  "
+        f"embedded {int(ok.sum())}/{len(texts)}"
+    )
+    return vectors
+
+
+def self_recall(backend, texts, vectors, queries: int, rng: random.Random):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+
+    hits = 0
+    for i in rng.sample(range(len(texts)), min(queries, len(texts))):
+        words = texts[i].split()
+        start = rng.randrange(0, len(words) - 20)
+        q_emb, _ = backend.embed([" ".join(words[start:start + 20])])
+        _, found = index.search(q_emb, 1)
+        hits += int(found[0][0] == i)
+    print(f"  local   self-recall@1 {hits / min(queries, len(texts)):.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local vs remote embedding throughput")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    from backend.services.rag_service import EMBEDDING_DIM
+    from backend.services.embedding_backends import (
+        LocalEmbeddingBackend, OpenAIEmbeddingBackend
+    )
+
+    server, _ = start_stub(EMBEDDING_DIM, args.latency, fail_rate=0.0)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    rng = random.Random(1)
+    texts = make_chunks(args.chunks, rng)
+    local = LocalEmbeddingBackend(EMBEDDING_DIM)
+
+    print(f"\n📊 {args.chunks} chunks, remote stub latency {args.latency}s")
+    vectors = throughput("local", local, texts)
+    throughput("remote", OpenAIEmbeddingBackend(EMBEDDING_DIM), texts)
+    self_recall(local, texts, vectors, args.queries, rng)
+
+    server.shutdown()
@@ -0,0 +1,135 @@
+"""
+Benchmark: embedding pipeline against a local stub embeddings server
+
+Starts an OpenAI-compatible /v1/embeddings stub with configurable latency and
+429/500 failure rates, points the OpenAI client at it, then embeds the same
+synthetic workbook with
+
+  serial      the old behaviour: batches of 20, one at a time, no retry
+  pipeline    BatchEmbedder with the configured concurrency, rate limits,
+              adaptive batches and retry
+
+It reports wall time, rows embedded, HTTP requests and that every returned
+vector belongs to its own text (the stub derives vectors from the text).
+
+Usage:
+    python -m backend.scripts.bench_embeddings --chunks 600 --latency 0.15 --fail-rate 0.1
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def stub_vector(text: str, dim: int) -> np.ndarray:
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    return rng.random(dim, dtype="float32")
+
+
+def start_stub(dim: int, latency: float, fail_rate: float):
+    stats = {"requests": 0, "failures": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = body["input"]
+            with lock:
+                stats["requests"] += 1
+
+            # Latency grows a little with batch size, like the real API
+            time.sleep(latency * (1 + len(texts) / 256))
+
+            if random.random() < fail_rate:
+                with lock:
+                    stats["failures"] += 1
+                status = random.choice([429, 500])
+                payload = {"error": {"message": "stub failure", "type": "stub"}}
+            else:
+                status = 200
+                payload = {
+                    "object": "list",
+                    "model": body.get("model"),
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": stub_vector(t, dim).tolist()}
+                        for i, t in enumerate(texts)
+                    ],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                }
+
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def run(name, embedder, texts, stats, dim):
+    stats["requests"] = stats["failures"] = 0
+    last_report = [0.0]
+
+    def progress(done, total):
+        now = time.perf_counter()
+        if now - last_report[0] > 1 or done == total:
+            last_report[0] = now
+            print(f"    {name}: {done}/{total}")
+
+    t0 = time.perf_counter()
+    vectors, ok = embedder.embed(texts, progress)
+    elapsed = time.perf_counter() - t0
+
+    misaligned = sum(
+        1 for i in np.flatnonzero(ok) if not np.allclose(vectors[i], stub_vector(texts[i], dim))
+    )
+    print(
+        f"  {name:<9} {elapsed:6.2f}s  embedded {int(ok.sum())}/{len(texts)}  "
+        f"requests {stats['requests']} ({stats['failures']} failed)  misaligned {misaligned}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding pipeline vs stub server")
+    parser.add_argument("--chunks", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    from backend.services.rag_service import EMBEDDING_DIM
+
+    server, stats = start_stub(EMBEDDING_DIM, args.latency, args.fail_rate)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    from backend.services.embedding_backends import OpenAIEmbeddingBackend
+    from backend.services.embedding_pipeline import BatchEmbedder
+
+    embed_batch = OpenAIEmbeddingBackend(EMBEDDING_DIM)._embed_batch
+
+    texts = [f"chunk {i}: " + "workbook text " * 70 for i in range(args.chunks)]
+
+    print(f"\n📊 {args.chunks} chunks, latency {args.latency}s, fail rate {args.fail_rate:.0%}")
+    serial = BatchEmbedder(
+        embed_batch, EMBEDDING_DIM,
+        max_workers=1, batch_size=20, max_retries=0, adaptive=False
+    )
+    pipeline = BatchEmbedder(embed_batch, EMBEDDING_DIM)
+
+    run("serial", serial, texts, stats, EMBEDDING_DIM)
+    run("pipeline", pipeline, texts, stats, EMBEDDING_DIM)
+
+    server.shutdown()
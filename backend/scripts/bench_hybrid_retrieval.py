@@ -0,0 +1,90 @@
+"""
+Benchmark: lexical (BM25) vs dense vs hybrid query retrieval
+
+Ingests the chunks of the given PDFs (plus optional filler chunks made of
+shuffled workbook words, to grow the unit) into a temporary index, then asks
+known-item queries: a random window of words taken from one chunk. For each
+retrieval mode it reports
+
+  hit@k      share of queries whose source chunk is in the top k
+  p50 / p99  end-to-end retrieve_context latency in milliseconds, which for
+             dense and hybrid includes embedding the query
+
+With the default local embedding backend the dense path costs no network
+round trip; pass --backend openai to measure the real one.
+
+Usage:
+    python -m backend.scripts.bench_hybrid_retrieval --queries 300
+    python -m backend.scripts.bench_hybrid_retrieval --filler 20000 --backend openai
+"""
+
+import argparse
+import glob
+import random
+import statistics
+import tempfile
+import time
+
+from backend.services.text_pipeline import chunk_text, iter_pdf_pages
+
+
+def load_chunks(paths):
+    chunks = []
+    for path in paths:
+        chunks.extend(chunk_text("".join(iter_pdf_pages(path))))
+    return list(dict.fromkeys(chunks))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query latency / hit rate per retrieval mode")
+    parser.add_argument("--pdf", nargs="+", default=sorted(glob.glob("uploads/*.pdf")))
+    parser.add_argument("--filler", type=int, default=5000, help="extra synthetic chunks")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backend", default="local")
+    args = parser.parse_args()
+
+    from backend.services.embedding_backends import get_embedding_backend
+    from backend.services.rag_service import EMBEDDING_DIM, RETRIEVAL_MODES, RAGService
+
+    rng = random.Random(0)
+    chunks = load_chunks(args.pdf)
+    words = " ".join(chunks).split()
+    filler = [" ".join(rng.choices(words, k=150)) for _ in range(args.filler)]
+
+    with tempfile.TemporaryDirectory() as root:
+        svc = RAGService(root)
+        svc._set_embedding_backend(get_embedding_backend(args.backend, EMBEDDING_DIM))
+
+        t0 = time.perf_counter()
+        corpus = chunks + filler
+        for start in range(0, len(corpus), 512):
+            svc._ingest_batch(corpus[start:start + 512], 1, 1, 1 + start // 512)
+        print(
+            f"\n📚 {len(chunks)} PDF chunks + {len(filler)} filler chunks indexed "
+            f"in {time.perf_counter() - t0:.1f}s ({svc.embedding_backend.name})"
+        )
+
+        queries = []
+        for _ in range(args.queries):
+            source = rng.choice(chunks)
+            tokens = source.split()
+            start = rng.randrange(max(1, len(tokens) - args.query_words))
+            queries.append((" ".join(tokens[start:start + args.query_words]), source))
+
+        print(f"📊 {len(queries)} known-item queries of {args.query_words} words, k={args.k}")
+        print(f"  {'mode':<8} {'hit@k':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in RETRIEVAL_MODES:
+            latencies, hits = [], 0
+            for query, source in queries:
+                t0 = time.perf_counter()
+                results = svc.retrieve_context(1, 1, query, top_k=args.k, mode=mode)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                hits += any(r["text"] == source for r in results)
+
+            latencies.sort()
+            print(
+                f"  {mode:<8} {hits / len(queries):7.3f} {statistics.median(latencies):8.2f} "
+                f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:8.2f}"
+            )
@@ -0,0 +1,113 @@
+"""
+Benchmark: Flat vs IVF vs HNSW segment indexes
+
+Builds each index type from backend.services.index_factory over synthetic,
+clustered, L2-normalised corpora (embedding-like) and reports, per corpus size:
+
+  build      seconds to train + add
+  recall@k   against the exact Flat results, for plain queries and for
+             unit-filtered queries (IDSelectorBatch over ~2% of the ids,
+             which is how retrieval searches)
+  p50 / p99  single-query latency in milliseconds
+
+Corpora whose vectors would not fit in --max-gb are skipped.
+
+Usage:
+    python -m backend.scripts.bench_index_types --sizes 10000,100000,1000000 --dim 1536
+    python -m backend.scripts.bench_index_types --sizes 10000,100000 --dim 256 --queries 200
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from backend.services.index_factory import INDEX_TYPES, build_index, search_parameters
+
+
+def sample(centers: np.ndarray, n: int, rng, spread: float, block: int = 50000) -> np.ndarray:
+    """Points scattered around random cluster centres, L2-normalised."""
+    vectors = np.empty((n, centers.shape[1]), dtype="float32")
+    for start in range(0, n, block):
+        end = min(n, start + block)
+        assign = rng.integers(0, len(centers), end - start)
+        noise = rng.standard_normal((end - start, centers.shape[1]), dtype="float32")
+        vectors[start:end] = centers[assign] + spread * noise
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def run_queries(index, queries: np.ndarray, k: int, selector=None):
+    params = search_parameters(index, selector, k)
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, ids = index.search(q[None, :], k, params=params)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth))
+    return hits / max(1, sum(int((t >= 0).sum()) for t in truth))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall / latency / build time per index type")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--unit-fraction", type=float, default=0.02)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--spread", type=float, default=2.0, help="noise around topic centres; higher is harder")
+    parser.add_argument("--max-gb", type=float, default=3.0, help="skip corpora larger than this")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    types = [t.strip() for t in args.types.split(",")]
+
+    for n in (int(s) for s in args.sizes.split(",")):
+        gb = n * args.dim * 4 / 1e9
+        if gb > args.max_gb:
+            print(f"\n⏭️ {n} x {args.dim}: {gb:.1f} GB of vectors exceeds --max-gb {args.max_gb}")
+            continue
+
+        # Queries are fresh samples from the corpus topics, not corpus points
+        centers = rng.standard_normal((256, args.dim), dtype="float32")
+        corpus = sample(centers, n, rng, args.spread)
+        ids = np.arange(n, dtype="int64")
+        queries = sample(centers, min(args.queries, n), rng, args.spread)
+        unit_ids = np.sort(rng.choice(n, max(args.k, int(n * args.unit_fraction)), replace=False))
+
+        print(f"\n📊 {n} vectors x {args.dim} dims, {len(queries)} queries, k={args.k}")
+        print(
+            f"  {'type':<6} {'build s':>9} {'recall':>8} {'p50 ms':>8} {'p99 ms':>8}"
+            f"   {'unit recall':>11} {'p50 ms':>8} {'p99 ms':>8}"
+        )
+
+        truth = truth_unit = None
+        for index_type in ["flat"] + [t for t in types if t != "flat"]:
+            t0 = time.perf_counter()
+            index = build_index(corpus, ids, args.dim, index_type, min_vectors=0)
+            build_s = time.perf_counter() - t0
+
+            found, lat = run_queries(index, queries, args.k)
+            found_unit, lat_unit = run_queries(
+                index, queries, args.k, faiss.IDSelectorBatch(unit_ids)
+            )
+            if index_type == "flat":
+                truth, truth_unit = found, found_unit
+
+            if index_type in types:
+                print(
+                    f"  {index_type:<6} {build_s:9.2f} {recall(found, truth):8.3f} "
+                    f"{np.percentile(lat, 50):8.3f} {np.percentile(lat, 99):8.3f}"
+                    f"   {recall(found_unit, truth_unit):11.3f} "
+                    f"{np.percentile(lat_unit, 50):8.3f} {np.percentile(lat_unit, 99):8.3f}"
+                )
+            del index
+
+        del corpus
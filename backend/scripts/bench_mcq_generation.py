@@ -0,0 +1,82 @@
+"""
+Benchmark: one LLM call per question vs one batched call per quiz
+
+Indexes the chunks of the given PDFs into a temporary store, then generates
+the same number of quizzes with each MCQ_GENERATION mode and reports, per
+quiz,
+
+  calls      LLM round trips (the batch mode adds one only for a top-up)
+  prompt     prompt tokens sent, as reported by the API
+  output     completion tokens received
+  wall s     generate_quiz wall time
+  questions  valid questions returned (of the difficulty's count)
+
+Needs GROQ_API_KEY; every quiz is real API usage.
+
+Usage:
+    python -m backend.scripts.bench_mcq_generation --quizzes 3 --difficulty hard
+"""
+
+import argparse
+import glob
+import statistics
+import sys
+import tempfile
+import time
+
+from backend.scripts.bench_hybrid_retrieval import load_chunks
+
+MODES = ("single", "batch")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM calls / tokens / wall time per quiz")
+    parser.add_argument("--pdf", nargs="+", default=sorted(glob.glob("uploads/*.pdf")))
+    parser.add_argument("--quizzes", type=int, default=3, help="quizzes per mode")
+    parser.add_argument("--difficulty", default="hard")
+    parser.add_argument("--backend", default="local")
+    args = parser.parse_args()
+
+    from backend.services import ai_service
+    from backend.services.context_assembler import ContextAssembler
+    from backend.services.embedding_backends import get_embedding_backend
+    from backend.services.rag_service import EMBEDDING_DIM, RAGService
+
+    if not ai_service.GROQ_AVAILABLE:
+        print("❌ GROQ_API_KEY is required for this benchmark")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as root:
+        svc = RAGService(root)
+        svc._set_embedding_backend(get_embedding_backend(args.backend, EMBEDDING_DIM))
+        chunks = load_chunks(args.pdf)
+        svc._ingest_batch(chunks, 1, 1, 1)
+        # Generate from the temporary index instead of the app's
+        ai_service.context_assembler = ContextAssembler(svc.retrieve_context, svc.unit_digest)
+
+        count = ai_service.DIFFICULTY_QUESTION_COUNT.get(args.difficulty, 8)
+        print(f"\n📚 {len(chunks)} chunks, {args.quizzes} {args.difficulty} quizzes ({count} questions) per mode")
+        print(f"  {'mode':<7} {'calls':>6} {'prompt':>8} {'output':>8} {'wall s':>7} {'questions':>10}")
+
+        for mode in MODES:
+            ai_service.MCQ_GENERATION = mode
+            rows = []
+            for _ in range(args.quizzes):
+                before = ai_service.llm_stats()
+                t0 = time.perf_counter()
+                quiz = ai_service.generate_quiz(1, 1, args.difficulty)
+                wall = time.perf_counter() - t0
+                after = ai_service.llm_stats()
+                rows.append((
+                    after["calls"] - before["calls"],
+                    after["prompt_tokens"] - before["prompt_tokens"],
+                    after["completion_tokens"] - before["completion_tokens"],
+                    wall,
+                    len(quiz["questions"])
+                ))
+
+            calls, prompt, output, wall, questions = (statistics.mean(col) for col in zip(*rows))
+            print(
+                f"  {mode:<7} {calls:6.1f} {prompt:8.0f} {output:8.0f} "
+                f"{wall:7.2f} {questions:6.1f}/{count}"
+            )
@@ -0,0 +1,118 @@
+"""
+Benchmark: unit-scoped vector search
+
+Compares the old over-fetch-and-filter query path (search the whole index for
+top_k * 3 neighbours, then drop chunks outside the unit) with the
+IDSelector-restricted search used by RAGService.retrieve_context.
+
+The synthetic corpus is skewed on purpose: one subject owns most chunks and
+the remaining chunks are spread over many small units.
+
+Usage:
+    python -m backend.scripts.bench_unit_search --sizes 10000 100000
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from backend.services.rag_service import RAGService
+from backend.services.segment_store import Segment, build_segment
+
+
+def build_corpus(n_chunks: int, dim: int, dominant_share: float) -> Segment:
+    rng = np.random.default_rng(42)
+    vectors = rng.random((n_chunks, dim), dtype="float32")
+
+    n_dominant = int(n_chunks * dominant_share)
+    small_units = 50
+    per_unit = max(1, (n_chunks - n_dominant) // small_units)
+
+    # subject 1 / unit 1 dominates, subject 2 holds the small units
+    records = []
+    for i in range(n_chunks):
+        if i < n_dominant:
+            subject_id, unit_id = 1, 1
+        else:
+            subject_id, unit_id = 2, 100 + min((i - n_dominant) // per_unit, small_units - 1)
+        records.append({
+            "chunk_id": i,
+            "subject_id": subject_id,
+            "unit_id": unit_id,
+            "document_id": subject_id,
+            "text": "x",
+            "has_vector": True
+        })
+
+    meta, text, _, index = build_segment(records, vectors, dim)
+    return Segment({"id": 0, "sources": [0]}, meta, text, index)
+
+
+def overfetch_search(segment: Segment, q_emb: np.ndarray, key, top_k: int):
+    """The pre-selector query path, kept here only for comparison."""
+    positions = segment.units[key]
+    valid_ids = set(segment.meta["chunk_id"][positions].tolist())
+    k = min(top_k * 3, segment.index.ntotal)
+    _, indices = segment.index.search(q_emb, k)
+
+    results = []
+    for idx in indices[0]:
+        if idx in valid_ids:
+            results.append(segment.record(segment.position_of(int(idx))))
+        if len(results) >= top_k:
+            break
+    return results
+
+
+def run(n_chunks: int, dim: int, top_k: int, queries: int, dominant_share: float):
+    rng = np.random.default_rng(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        svc = RAGService(vector_db_dir=tmp)
+
+        t0 = time.perf_counter()
+        segment = build_corpus(n_chunks, dim, dominant_share)
+        segments = [segment]
+        build_s = time.perf_counter() - t0
+
+        small_keys = [k for k in segment.units if k[0] == 2]
+
+        stats = {"overfetch": ([], []), "selector": ([], [])}
+        for _ in range(queries):
+            key = small_keys[rng.integers(len(small_keys))]
+            q_emb = rng.random((1, dim), dtype="float32")
+            expected = min(top_k, len(segment.units[key]))
+
+            for name, fn in (
+                ("overfetch", lambda q, k: overfetch_search(segment, q, k, top_k)),
+                ("selector", lambda q, k: svc._search_unit(q, k, segments, top_k)),
+            ):
+                t0 = time.perf_counter()
+                results = fn(q_emb, key)
+                stats[name][0].append((time.perf_counter() - t0) * 1000)
+                stats[name][1].append(len(results) / expected)
+
+    print(f"\n📊 {n_chunks} chunks, dim={dim}, top_k={top_k}, build {build_s:.2f}s")
+    for name, (latencies, completeness) in stats.items():
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"  {name:<10} p50 {statistics.median(latencies):7.2f} ms  "
+            f"p99 {p99:7.2f} ms  completeness {statistics.mean(completeness):6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dominant-share", type=float, default=0.9)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.dim, args.top_k, args.queries, args.dominant_share)
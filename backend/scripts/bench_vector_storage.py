@@ -0,0 +1,92 @@
+"""
+Benchmark: compressed vector storage (float16 / SQ8 / PQ / PCA)
+
+Builds a flat segment index for each storage option from
+backend.services.index_factory over the same synthetic corpus and reports
+
+  bytes/vec       serialised index size per vector (what a worker holds)
+  MB per 100k     the same, scaled to a 100k-chunk corpus
+  recall@k        against exact float32 results, straight from the index
+  +rerank         after fetching k * RERANK_FACTOR candidates and
+                  re-ranking them on the float32 vectors, as retrieval does
+  p50 ms          single-query latency including the re-rank
+
+Options are STORAGE or pcaDIM+STORAGE, e.g. "pca384+sq8".
+
+Usage:
+    python -m backend.scripts.bench_vector_storage --vectors 20000 --dim 1536
+    python -m backend.scripts.bench_vector_storage --options float32,sq8,pca256+fp16
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from backend.scripts.bench_index_types import recall, sample
+from backend.services.index_factory import (
+    RERANK_FACTOR, build_index, exact_rerank, search_parameters
+)
+
+
+def parse_option(option: str):
+    if "+" in option:
+        pca, storage = option.split("+", 1)
+        return storage, int(pca[len("pca"):])
+    return option, 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory / recall per vector storage option")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--spread", type=float, default=2.0)
+    parser.add_argument("--options", default="float32,fp16,sq8,pq,pca384+fp16,pca384+sq8,pca256+pq")
+    parser.add_argument("--rerank-factor", type=int, default=RERANK_FACTOR)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, args.dim), dtype="float32")
+    corpus = sample(centers, args.vectors, rng, args.spread)
+    queries = sample(centers, args.queries, rng, args.spread)
+    ids = np.arange(args.vectors, dtype="int64")
+
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"\n📊 {args.vectors} vectors x {args.dim} dims, {args.queries} queries, k={args.k}")
+    print(
+        f"  {'option':<14} {'build s':>8} {'bytes/vec':>10} {'MB per 100k':>12} "
+        f"{'recall':>8} {'+rerank':>8} {'p50 ms':>8}"
+    )
+
+    for option in args.options.split(","):
+        storage, pca_dim = parse_option(option.strip())
+
+        t0 = time.perf_counter()
+        index = build_index(corpus, ids, args.dim, "flat", storage, pca_dim, min_vectors=0)
+        build_s = time.perf_counter() - t0
+        per_vector = len(faiss.serialize_index(index)) / args.vectors
+
+        params = search_parameters(index)
+        _, raw = index.search(queries, args.k, params=params)
+
+        fetch = args.k * args.rerank_factor if option != "float32" else args.k
+        reranked, latencies = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            _, found = index.search(q[None, :], fetch, params=params)
+            found = found[0][found[0] >= 0]
+            _, top = exact_rerank(q, found, corpus[found], args.k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            reranked.append(top)
+
+        print(
+            f"  {option:<14} {build_s:8.2f} {per_vector:10.0f} {per_vector * 1e5 / 2**20:12.1f} "
+            f"{recall(raw, truth):8.3f} {recall(np.array(reranked), truth):8.3f} "
+            f"{np.percentile(latencies, 50):8.3f}"
+        )
@@ -0,0 +1,43 @@
+"""
+Compact the vector index
+
+Merges each subject's segments into one and drops the chunks of deleted
+(tombstoned) documents, then reports the memory and disk that reclaimed. An
+index from before per-subject shards is split into them. Safe to run next
+to live gunicorn workers: they pick up the new manifest on their next query.
+
+Usage:
+    python -m backend.scripts.compact_index --vector-db vector_db
+"""
+
+import argparse
+
+
+def mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.2f} MB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop deleted documents from the vector index")
+    parser.add_argument("--vector-db", default="vector_db")
+    args = parser.parse_args()
+
+    from backend.services.rag_service import RAGService
+
+    stats = RAGService(args.vector_db).compact_index()
+
+    if not stats["compacted"]:
+        print("ℹ️ Nothing to compact")
+    print(f"  segments   {stats['segments_before']} -> {stats['segments_after']}")
+    print(
+        f"  chunks     {stats['chunks_before']} -> {stats['chunks_after']} "
+        f"({stats['dead_chunks_removed']} deleted chunks removed)"
+    )
+    print(
+        f"  memory     {mb(stats['memory_bytes_before'])} -> {mb(stats['memory_bytes_after'])} "
+        f"(reclaimed {mb(stats['memory_bytes_reclaimed'])})"
+    )
+    print(
+        f"  disk       {mb(stats['disk_bytes_before'])} -> {mb(stats['disk_bytes_after'])} "
+        f"(reclaimed {mb(stats['disk_bytes_reclaimed'])})"
+    )
@@ -0,0 +1,121 @@
+"""
+Measure per-worker memory of RAGService in private vs shared (mmap) mode.
+
+Builds a synthetic segment store, then starts 1, 4 and 8 worker processes the
+way gunicorn does (each imports and loads its own RAGService), runs a few
+retrievals in each and reports RSS and PSS per worker. PSS splits shared
+pages between the processes mapping them, so it shows the real cost of one
+more worker.
+
+Usage:
+    python -m backend.scripts.measure_worker_rss --chunks 20000
+"""
+
+import argparse
+import multiprocessing as mp
+import statistics
+import tempfile
+
+import numpy as np
+
+
+def _memory_kb():
+    rss = pss = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1])
+    return rss, pss
+
+
+def _worker(vector_db_dir, shared, queries, ready, release, results):
+    from backend.services.rag_service import RAGService, EMBEDDING_DIM
+
+    svc = RAGService(vector_db_dir=vector_db_dir, shared=shared)
+    rng = np.random.default_rng()
+    keys = sorted({
+        k for subject_id in svc.entries for s in svc.shard_segments(subject_id) for k in s.units
+    })
+
+    for _ in range(queries):
+        key = keys[rng.integers(len(keys))]
+        segments = [s for s in svc.shard_segments(key[0]) if key in s.units]
+        q_emb = rng.random((1, EMBEDDING_DIM), dtype="float32")
+        for chunk in svc._search_unit(q_emb, key, segments, 5):
+            len(chunk["text"])
+        svc.retrieve_context(*key, top_k=5)
+
+    # Measure only once every worker is loaded, so shared pages are split
+    ready.wait()
+    results.put(_memory_kb())
+    release.wait()
+
+
+def build_store(root: str, chunks: int, units: int):
+    from backend.services.segment_store import SegmentStore
+    from backend.services.rag_service import EMBEDDING_DIM
+
+    store = SegmentStore(root, EMBEDDING_DIM)
+    rng = np.random.default_rng(0)
+    per_segment = 5000
+
+    for start in range(0, chunks, per_segment):
+        n = min(per_segment, chunks - start)
+        records = [
+            {
+                "subject_id": 1 + (start + i) % 5,
+                "unit_id": 1 + (start + i) % units,
+                "document_id": 1,
+                "text": f"chunk {start + i} " + "lorem ipsum dolor " * 55
+            }
+            for i in range(n)
+        ]
+        store.append_segment(records, rng.random((n, EMBEDDING_DIM), dtype="float32"))
+
+    store.compact()
+
+
+def measure(root: str, shared: bool, workers: int, queries: int):
+    ctx = mp.get_context("spawn")
+    ready = ctx.Barrier(workers + 1)
+    release = ctx.Event()
+    results = ctx.Queue()
+
+    procs = [
+        ctx.Process(target=_worker, args=(root, shared, queries, ready, release, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+
+    ready.wait()
+    samples = [results.get() for _ in procs]
+    release.set()
+    for p in procs:
+        p.join()
+
+    rss = [s[0] / 1024 for s in samples]
+    pss = [s[1] / 1024 for s in samples]
+    mode = "shared " if shared else "private"
+    print(
+        f"  {mode} workers={workers}  RSS/worker {statistics.mean(rss):7.1f} MB  "
+        f"PSS/worker {statistics.mean(pss):7.1f} MB  total PSS {sum(pss):7.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-worker RSS of RAGService")
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--units", type=int, default=25)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        build_store(root, args.chunks, args.units)
+        print(f"\n📊 {args.chunks} chunks")
+        for workers in args.workers:
+            for shared in (False, True):
+                measure(root, shared, workers, args.queries)
@@ -0,0 +1,205 @@
+"""
+Rebuild the vector index from the documents table
+
+Re-ingests every processed document (linked duplicates share their owner's
+chunks and are rebuilt once, under the owner's id, even after the owner row
+itself was deleted) into a side directory next to the live index, using
+the current chunking, embedding and index settings. This is also how the
+index type (RAG_INDEX_TYPE: flat, ivf, hnsw) and vector storage
+(RAG_VECTOR_STORAGE, RAG_PCA_DIM) are switched. Documents are
+ingested in parallel; PDF pages are additionally parsed in a process pool.
+
+Progress is checkpointed after every document, so an interrupted rebuild
+resumes where it stopped (documents that were half-written are purged and
+redone). When every document is done, the new segments replace the live
+ones with a single manifest commit, which running workers pick up on their
+next query. Throughput is reported in pages/s and chunks/s.
+
+Usage:
+    python -m backend.scripts.rebuild_index --vector-db vector_db --workers 4
+    python -m backend.scripts.rebuild_index --fresh   # discard a checkpoint
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHECKPOINT_FILE = "rebuild.json"
+
+
+def load_documents():
+    from backend.models.database import SessionLocal, Document, Unit
+
+    db = SessionLocal()
+    try:
+        rows = db.query(Document, Unit).join(Unit, Document.unit_id == Unit.id).filter(
+            Document.is_processed == True
+        ).order_by(Document.id).all()
+    finally:
+        db.close()
+
+    # Chunks are tagged with the owning upload's id. Links keep sharing them
+    # after the owner row is deleted, so one entry per owner id still in use,
+    # read from the owner's file or any surviving link's
+    documents = {}
+    for doc, unit in rows:
+        owner_id = doc.source_document_id or doc.id
+        if owner_id in documents and doc.id != owner_id:
+            continue
+        documents[owner_id] = {
+            "id": owner_id,
+            "subject_id": unit.subject_id,
+            "unit_id": unit.id,
+            "file_path": doc.file_path,
+            "filename": doc.original_filename
+        }
+    return [documents[owner_id] for owner_id in sorted(documents)]
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {"done": {}, "in_progress": []}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def _save(self):
+        from backend.services.segment_store import atomic_write
+        atomic_write(self.path, json.dumps(self.state, indent=1).encode("utf-8"))
+
+    def set(self, key, value):
+        with self._lock:
+            self.state[key] = value
+            self._save()
+
+    def start(self, doc_id: int):
+        with self._lock:
+            self.state["in_progress"].append(doc_id)
+            self._save()
+
+    def finish(self, doc_id: int, pages: int, chunks: int):
+        with self._lock:
+            self.state["in_progress"].remove(doc_id)
+            self.state["done"][str(doc_id)] = {"pages": pages, "chunks": chunks}
+            self._save()
+
+
+def rebuild(vector_db: str, workers: int, fresh: bool, swap: bool):
+    from backend.services.rag_service import RAGService, EMBEDDING_DIM
+    from backend.services.segment_store import SegmentStore
+
+    side_dir = f"{vector_db.rstrip(os.sep)}.rebuild"
+    if fresh and os.path.exists(side_dir):
+        shutil.rmtree(side_dir)
+    os.makedirs(side_dir, exist_ok=True)
+
+    live = SegmentStore(vector_db, EMBEDDING_DIM)
+    checkpoint = Checkpoint(os.path.join(side_dir, CHECKPOINT_FILE))
+    # Live chunks from here on are uploads the rebuild may miss; everything
+    # older is replaced (or dropped, if no document produced it)
+    if "carry_from" not in checkpoint.state:
+        manifest = live.read_manifest()
+        checkpoint.set("carry_from", manifest["next_chunk_id"])
+        # Tombstoned ids the documents table lists again were reused by new
+        # uploads; the rebuild makes their chunks visible again
+        checkpoint.set("tombstones", manifest.get("tombstones", []))
+    side = RAGService(side_dir, shared=False)
+
+    unfinished = checkpoint.state["in_progress"]
+    if unfinished:
+        print(f"🧹 Purging {len(unfinished)} half-written documents from the last run")
+        side.store.compact(force=True, drop_documents=unfinished)
+        side = RAGService(side_dir, shared=False)
+        checkpoint.set("in_progress", [])
+
+    documents = load_documents()
+    todo = [d for d in documents if str(d["id"]) not in checkpoint.state["done"]]
+    print(
+        f"\n📚 {len(documents)} documents, {len(documents) - len(todo)} already rebuilt, "
+        f"{len(todo)} to go ({workers} workers, backend {side.embedding_backend.name})"
+    )
+
+    def ingest(doc):
+        if not os.path.exists(doc["file_path"]):
+            raise FileNotFoundError(doc["file_path"])
+
+        pages = [0]
+
+        def progress(stage, pages_parsed, created, embedded):
+            pages[0] = pages_parsed
+
+        checkpoint.start(doc["id"])
+        chunks = side.ingest_document(
+            doc["file_path"], doc["subject_id"], doc["unit_id"], doc["id"],
+            progress=progress
+        )
+        checkpoint.finish(doc["id"], pages[0], chunks)
+        return pages[0], chunks
+
+    total_pages = total_chunks = failed = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rebuild") as pool:
+        futures = {pool.submit(ingest, doc): doc for doc in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            doc = futures[future]
+            try:
+                pages, chunks = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ [{n}/{len(todo)}] document {doc['id']} ({doc['filename']}): {e}")
+                continue
+            total_pages += pages
+            total_chunks += chunks
+            elapsed = time.perf_counter() - t0
+            print(
+                f"✅ [{n}/{len(todo)}] document {doc['id']} ({doc['filename']}): "
+                f"{pages} pages, {chunks} chunks  |  "
+                f"{total_pages / elapsed:.1f} pages/s, {total_chunks / elapsed:.1f} chunks/s"
+            )
+
+    elapsed = time.perf_counter() - t0
+    if todo:
+        print(
+            f"\n⏱️ {total_pages} pages, {total_chunks} chunks in {elapsed:.1f}s "
+            f"({total_pages / max(elapsed, 1e-9):.1f} pages/s, "
+            f"{total_chunks / max(elapsed, 1e-9):.1f} chunks/s)"
+        )
+
+    if failed:
+        print(f"⚠️ {failed} documents failed; fix them and run again to resume")
+        return
+    if not swap:
+        print(f"ℹ️ Rebuilt index left in {side_dir}")
+        return
+
+    # Let a background merge in the side store finish, then merge the rest,
+    # so the swapped-in index is one large segment per subject (where IVF /
+    # HNSW pay off)
+    with side._compaction_lock:
+        side.store.compact()
+        manifest = live.adopt(
+            side.store, checkpoint.state["done"].keys(), checkpoint.state["carry_from"],
+            revived=checkpoint.state.get("tombstones", [])
+        )
+    shutil.rmtree(side_dir)
+    print(
+        f"🔁 Live index swapped: {len(manifest['segments'])} segments, "
+        f"generation {manifest['generation']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild vector_db/ from the documents table")
+    parser.add_argument("--vector-db", default="vector_db")
+    parser.add_argument("--workers", type=int, default=4, help="documents ingested in parallel")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--no-swap", action="store_true", help="build only; keep the live index")
+    args = parser.parse_args()
+
+    rebuild(args.vector_db, args.workers, args.fresh, not args.no_swap)
@@ -0,0 +1,191 @@
+"""
+Stress test: concurrent retrieval, ingestion and deletion in one RAGService
+
+Runs reader threads (retrieve_context, with and without a query) against
+writer threads (embedding + appending chunks, as ingest_document does), a
+deleter (tombstoning freshly written documents) and background compaction,
+all on one service instance, the way a threaded gunicorn worker would. It
+checks, on every call, that
+
+  - no call raises
+  - every result belongs to the requested subject / unit
+  - no result belongs to a document whose delete returned before the
+    retrieval started
+  - every chunk a writer appended is retrievable once its write returned
+
+and reports retrieval throughput and latency next to the write rate. Exits
+non-zero on any violation.
+
+Usage:
+    python -m backend.scripts.stress_rag_concurrency --seconds 20 --readers 8 --writers 2
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+SUBJECTS = 4
+UNITS = 3
+
+
+def build_store(root: str, chunks: int, dim: int):
+    from backend.services.segment_store import SegmentStore
+
+    store = SegmentStore(root, dim)
+    rng = np.random.default_rng(0)
+    for start in range(0, chunks, 500):
+        n = min(500, chunks - start)
+        for subject_id in range(1, SUBJECTS + 1):
+            records = [
+                {
+                    "subject_id": subject_id,
+                    "unit_id": 1 + i % UNITS,
+                    "document_id": subject_id,
+                    "text": f"seed chunk {start + i} of subject {subject_id} " * 8
+                }
+                for i in range(n)
+            ]
+            store.append_segment(records, rng.random((n, dim), dtype="float32"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent readers and writers on one RAGService")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--chunks", type=int, default=2000, help="seed chunks per subject")
+    parser.add_argument("--batch", type=int, default=16, help="chunks per write")
+    args = parser.parse_args()
+
+    from backend.services import rag_service as rag_module
+    from backend.services.embedding_backends import get_embedding_backend
+
+    # Merge often, so compaction races the readers too
+    rag_module.COMPACT_MIN_SEGMENTS = 4
+
+    with tempfile.TemporaryDirectory() as root:
+        build_store(root, args.chunks, rag_module.EMBEDDING_DIM)
+        svc = rag_module.RAGService(root)
+        # Local embeddings: the test measures the service, not an API
+        svc._set_embedding_backend(get_embedding_backend("local", rag_module.EMBEDDING_DIM))
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        deleted = set()                 # delete_document() has returned
+        written = []                    # (subject, unit, document, texts) whose write returned
+        doc_ids = itertools.count(1000)
+        violations, errors = [], []
+        latencies, write_count = [], [0]
+
+        def violation(message):
+            with lock:
+                violations.append(message)
+
+        def reader(seed):
+            rng = random.Random(seed)
+            local = []
+            while not stop.is_set():
+                subject_id, unit_id = rng.randint(1, SUBJECTS), rng.randint(1, UNITS)
+                with lock:
+                    gone = set(deleted)
+                query = rng.choice(["", "seed chunk", "fresh chunk about photosynthesis"])
+                t0 = time.perf_counter()
+                try:
+                    results = svc.retrieve_context(subject_id, unit_id, query, top_k=5)
+                except Exception as e:
+                    with lock:
+                        errors.append(f"retrieve: {e!r}")
+                    continue
+                local.append((time.perf_counter() - t0) * 1000)
+                for r in results:
+                    if (r["subject_id"], r["unit_id"]) != (subject_id, unit_id):
+                        violation(f"chunk {r['chunk_id']} of {r['subject_id']}/{r['unit_id']} for {subject_id}/{unit_id}")
+                    if r["document_id"] in gone:
+                        violation(f"chunk {r['chunk_id']} of deleted document {r['document_id']}")
+            with lock:
+                latencies.extend(local)
+
+        def writer(seed):
+            rng = random.Random(seed)
+            while not stop.is_set():
+                subject_id, unit_id, document_id = rng.randint(1, SUBJECTS), rng.randint(1, UNITS), next(doc_ids)
+                texts = [f"fresh chunk {document_id}-{i} about photosynthesis " * 6 for i in range(args.batch)]
+                try:
+                    svc._ingest_batch(texts, subject_id, unit_id, document_id)
+                except Exception as e:
+                    with lock:
+                        errors.append(f"ingest: {e!r}")
+                    continue
+
+                # Read-your-writes: the whole unit, sampled without a query
+                seen = {
+                    r["text"] for r in svc.retrieve_context(subject_id, unit_id, "", top_k=10 ** 6)
+                }
+                with lock:
+                    gone = document_id in deleted
+                if not gone and not set(texts) <= seen:
+                    violation(f"document {document_id}: {len(set(texts) - seen)} written chunks not visible")
+                with lock:
+                    written.append((subject_id, unit_id, document_id))
+                    write_count[0] += 1
+
+        def deleter():
+            while not stop.is_set():
+                time.sleep(0.2)
+                with lock:
+                    if not written:
+                        continue
+                    _, _, document_id = written.pop(random.randrange(len(written)))
+                try:
+                    svc.delete_document(document_id)
+                except Exception as e:
+                    with lock:
+                        errors.append(f"delete: {e!r}")
+                    continue
+                with lock:
+                    deleted.add(document_id)
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(100 + i,)) for i in range(args.writers)]
+        threads.append(threading.Thread(target=deleter))
+
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        # Let a background compaction finish before the store is removed
+        with svc._compaction_lock:
+            pass
+
+        latencies.sort()
+        print(
+            f"\n📊 {args.readers} readers, {args.writers} writers, {elapsed:.1f}s, "
+            f"generation {svc.generation}, {svc.chunk_count} chunks"
+        )
+        if latencies:
+            print(
+                f"  retrievals  {len(latencies)} ({len(latencies) / elapsed:.0f}/s)  "
+                f"p50 {statistics.median(latencies):.2f} ms  "
+                f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:.2f} ms"
+            )
+        print(f"  writes      {write_count[0]} batches of {args.batch} chunks, {len(deleted)} documents deleted")
+        print(f"  errors      {len(errors)}")
+        print(f"  violations  {len(violations)}")
+        for message in (errors + violations)[:10]:
+            print(f"    {message}")
+
+    if errors or violations:
+        print("❌ Stress test failed")
+        sys.exit(1)
+    print("✅ Stress test passed")
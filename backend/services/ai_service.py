@@ -5,8 +5,14 @@ MCQs + Flashcards generated fully from document context based on difficulty
 
 import os
 import json
+import random
 import re
-from typing import Dict, List
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from backend.services.llm_pool import background_pool, llm_pool, LLMPool, LLM_DEADLINE_SECONDS
+from backend.services.question_bank import question_bank, question_key
 
 # ======================================================
 # GROQ SETUP
@@ -36,7 +42,7 @@ except Exception as e:
 # ======================================================
 
 try:
-    from backend.services.rag_service import rag_service
+    from backend.services.context_assembler import context_assembler
     RAG_AVAILABLE = True
 except Exception as e:
     print(f"⚠ RAG service import failed: {e}")
@@ -55,17 +61,94 @@ DIFFICULTY_QUESTION_COUNT = {
 
 FLASHCARD_COUNT = DIFFICULTY_QUESTION_COUNT
 
+# What an MCQ of each difficulty tests (also keeps the three question banks
+# of a unit distinct)
+DIFFICULTY_GUIDANCE = {
+    "easy": "Easy: direct recall of definitions, terms and basic facts",
+    "medium": "Medium: understanding and applying a concept to a simple case",
+    "hard": "Hard: multi-step reasoning, comparisons or numericals, with close distractors"
+}
+
+# Study material per prompt: "digest" (the unit's deduplicated key
+# sentences, extracted at ingestion) or "chunks" (raw retrieved chunks)
+CONTEXT_SOURCE = os.getenv("GENERATION_CONTEXT", "digest").strip().lower()
+
+# Study material tokens per prompt; digest sentences carry more per token
+if CONTEXT_SOURCE == "digest":
+    MCQ_CONTEXT_TOKENS = int(os.getenv("MCQ_DIGEST_TOKENS", 600))
+    FLASHCARD_CONTEXT_TOKENS = int(os.getenv("FLASHCARD_DIGEST_TOKENS", 800))
+else:
+    MCQ_CONTEXT_TOKENS = int(os.getenv("MCQ_CONTEXT_TOKENS", 1000))
+    FLASHCARD_CONTEXT_TOKENS = int(os.getenv("FLASHCARD_CONTEXT_TOKENS", 1150))
+
+# "batch": one call returns the whole quiz, a second call tops up the
+# questions that failed validation; "single": one call per question
+MCQ_GENERATION = os.getenv("MCQ_GENERATION", "batch").strip().lower()
+MCQ_BATCH_CONTEXT_TOKENS = int(os.getenv("MCQ_BATCH_CONTEXT_TOKENS", 2 * MCQ_CONTEXT_TOKENS))
+MCQ_TOP_UP_ROUNDS = int(os.getenv("MCQ_TOP_UP_ROUNDS", 1))
+# Questions per call when streaming: smaller concurrent batches put the first
+# question on screen after one short call instead of the whole quiz's call
+MCQ_STREAM_BATCH = int(os.getenv("MCQ_STREAM_BATCH", 3))
+# Completion tokens per question in a batch (question, 4 options, explanation)
+MCQ_TOKENS_PER_QUESTION = 160
+
+LLM_MODEL = "llama-3.1-8b-instant"
+
+# Identical concurrent requests (same unit and difficulty) share one live
+# generation. "shuffle": each joining user gets the shared questions in
+# their own order with their own option order; "share": identical copies;
+# "off": every request generates its own
+COALESCE_POLICY = os.getenv("GENERATION_COALESCE", "shuffle").strip().lower()
+
+
+# ======================================================
+# LLM CALLS
+# ======================================================
+
+_llm_lock = threading.Lock()
+_llm_stats = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+
+
+def _complete(prompt: str, temperature: float, max_tokens: int) -> str:
+    """One chat completion; calls, token usage and latency are recorded."""
+    t0 = time.perf_counter()
+    response = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+    elapsed = time.perf_counter() - t0
+
+    usage = getattr(response, "usage", None)
+    with _llm_lock:
+        _llm_stats["calls"] += 1
+        _llm_stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        _llm_stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+        _llm_stats["seconds"] += elapsed
+    return response.choices[0].message.content.strip()
+
+
+def llm_stats() -> Dict:
+    with _llm_lock:
+        stats = dict(_llm_stats)
+    calls = stats["calls"]
+    stats["seconds"] = round(stats["seconds"], 3)
+    stats["latency_ms_avg"] = round(stats["seconds"] * 1000 / calls, 1) if calls else None
+    return stats
+
 
 # ======================================================
 # MCQ GENERATOR (UNCHANGED)
 # ======================================================
 
-def _generate_mcq_from_context(context: str) -> Dict:
+def _generate_mcq_from_context(context: str, difficulty: str = "medium") -> Dict:
     if not GROQ_AVAILABLE or not client:
         return {}
 
     prompt = f"""
 Generate ONE exam-oriented MCQ.
+Difficulty: {DIFFICULTY_GUIDANCE.get(difficulty, DIFFICULTY_GUIDANCE["medium"])}
 
 Rules:
 - Don't repeat any question in the same quiz
@@ -78,7 +161,7 @@ Rules:
 - Don't repate question question 
 
 Study Material:
-{context[:3500]}
+{context}
 
 Return ONLY valid JSON:
 {{
@@ -89,18 +172,154 @@ Return ONLY valid JSON:
 }}
 """
 
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.4,
-        max_tokens=500
-    )
-
-    text = response.choices[0].message.content.strip()
+    text = _complete(prompt, temperature=0.4, max_tokens=500)
     match = re.search(r'\{.*\}', text, re.DOTALL)
     return json.loads(match.group()) if match else {}
 
 
+# ======================================================
+# BATCHED MCQ GENERATOR
+# ======================================================
+
+def _generate_mcq_batch(
+    context: str,
+    count: int,
+    avoid: List[str] = (),
+    difficulty: str = "medium"
+) -> List[Dict]:
+    """Ask for `count` MCQs in one call; returns the raw parsed items."""
+    if not GROQ_AVAILABLE or not client:
+        return []
+
+    avoid_block = ""
+    if avoid:
+        avoid_block = "\nAlready asked (do NOT repeat or rephrase these):\n" + "\n".join(f"- {q}" for q in avoid) + "\n"
+
+    prompt = f"""
+Generate EXACTLY {count} different exam-oriented MCQs.
+Difficulty: {DIFFICULTY_GUIDANCE.get(difficulty, DIFFICULTY_GUIDANCE["medium"])}
+
+Rules:
+- Every question tests a different concept
+- ask questions meaningfully based on the study material you can also generate questions beyond the context if needed
+- Concept based
+- 4 relevant, distinct options per question
+- One correct answer, "correct_index" is its position (0-3) in "options"
+- Short explanation
+- DCET/Diploma level
+{avoid_block}
+Study Material:
+{context}
+
+Return ONLY a valid JSON array of {count} objects:
+[
+  {{
+    "question": "",
+    "options": ["", "", "", ""],
+    "correct_index": 0,
+    "explanation": ""
+  }}
+]
+"""
+
+    text = _complete(prompt, temperature=0.4, max_tokens=MCQ_TOKENS_PER_QUESTION * count + 100)
+
+    try:
+        data = json.loads(text)
+    except Exception:
+        match = re.search(r'\[\s*\{.*\}\s*\]', text, re.DOTALL)
+        if not match:
+            return []
+        try:
+            data = json.loads(match.group())
+        except Exception:
+            return []
+    return data if isinstance(data, list) else []
+
+
+def _validate_mcq(item, seen: set) -> Dict:
+    """
+    The MCQ in canonical form, or {} when it is malformed: not exactly 4
+    distinct non-empty options, a correct_index outside them, or a
+    question already in `seen` (normalised question keys, updated here).
+    """
+    if not isinstance(item, dict):
+        return {}
+
+    question = str(item.get("question", "")).strip()
+    options = item.get("options")
+    if not question or not isinstance(options, list) or len(options) != 4:
+        return {}
+    options = [str(o).strip() for o in options]
+    if not all(options) or len({o.lower() for o in options}) != 4:
+        return {}
+
+    try:
+        correct_index = int(item.get("correct_index"))
+    except (TypeError, ValueError):
+        return {}
+    if not 0 <= correct_index < 4:
+        return {}
+
+    key = question_key(question)
+    if key in seen:
+        return {}
+    seen.add(key)
+
+    return {
+        "question": question,
+        "options": options,
+        "correct_index": correct_index,
+        "explanation": str(item.get("explanation", "")).strip()
+    }
+
+
+def _iter_batched(
+    contexts: List[Dict],
+    count: int,
+    per_call: int,
+    deadline: float,
+    pool: LLMPool = llm_pool,
+    difficulty: str = "medium"
+) -> Iterator[Dict]:
+    """
+    The quiz in calls of up to `per_call` questions, run concurrently, each
+    from its own context slice; valid questions are yielded as each call
+    returns. Only the shortfall (invalid or duplicate items) is requested
+    again, in one call from the next slice.
+    """
+    sizes = [per_call] * (count // per_call) + ([count % per_call] if count % per_call else [])
+    produced, seen = [], set()
+
+    def keep(items):
+        return [mcq for mcq in (_validate_mcq(item, seen) for item in items) if mcq]
+
+    calls = [
+        lambda text=contexts[i % len(contexts)]["text"], n=n: _generate_mcq_batch(text, n, difficulty=difficulty)
+        for i, n in enumerate(sizes)
+    ]
+    for batch in pool.stream(calls, validate=keep, deadline=deadline):
+        for mcq in batch[:count - len(produced)]:
+            produced.append(mcq)
+            yield mcq
+
+    for round_no in range(MCQ_TOP_UP_ROUNDS):
+        missing = count - len(produced)
+        if missing <= 0:
+            break
+        context = contexts[(len(sizes) + round_no) % len(contexts)]["text"]
+        avoid = [q["question"] for q in produced]
+        batches = pool.fan_out(
+            [lambda: _generate_mcq_batch(context, missing, avoid, difficulty)],
+            validate=keep,
+            deadline=deadline
+        )
+        for mcq in (batches[0] if batches else [])[:missing]:
+            produced.append(mcq)
+            yield mcq
+        print(f"🔁 MCQ top-up: {len(produced)}/{count} after {len(sizes) + round_no + 1} calls")
+
+
 # ======================================================
 # FLASHCARD GENERATOR (EXPLANATION-ONLY BACKSIDE)
 # ======================================================
@@ -131,7 +350,7 @@ BACK:
 - Simple, exam-oriented language
 
 Study Material:
-{context[:4000]}
+{context}
 
 Return ONLY valid JSON array:
 
@@ -143,14 +362,7 @@ Return ONLY valid JSON array:
 ]
 """
 
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-        max_tokens=1200
-    )
-
-    text = response.choices[0].message.content.strip()
+    text = _complete(prompt, temperature=0.2, max_tokens=1200)
 
     try:
         data = json.loads(text)
@@ -176,50 +388,311 @@ Return ONLY valid JSON array:
     return flashcards
 
 
+# ======================================================
+# SINGLE-FLIGHT (COALESCED LIVE GENERATION)
+# ======================================================
+
+_flights_lock = threading.Lock()
+_flights = {}
+_coalesce_stats = {"requests": 0, "flights": 0, "coalesced": 0, "max_readers": 0}
+
+
+class _Flight:
+    """
+    One live generation shared by identical concurrent requests. A thread
+    drives the source and buffers its items; every request reads the
+    buffer from the start, so late joiners get what is already there at
+    once. When the last reader leaves early the source is abandoned.
+    """
+
+    def __init__(self, key, start):
+        self.key = key
+        self.items = []
+        self.insufficient = False
+        self.done = False
+        self.abandoned = False
+        self.readers = 0
+        self.joined = 0
+        self.ready = threading.Event()
+        self._start = start
+        # All flights share the registry lock
+        self._cond = threading.Condition(_flights_lock)
+
+    def run(self):
+        source = None
+        try:
+            source = self._start()
+            self.insufficient = source is None
+            self.ready.set()
+            for item in source or ():
+                with self._cond:
+                    self.items.append(item)
+                    self._cond.notify_all()
+                    if self.abandoned:
+                        break
+        except Exception as e:
+            print(f"⚠️ Generation for {self.key} failed:", e)
+        finally:
+            if hasattr(source, "close"):
+                source.close()
+            self.ready.set()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+                if _flights.get(self.key) is self:
+                    del _flights[self.key]
+
+    def read(self) -> Iterator:
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self.items) and not self.done:
+                        self._cond.wait()
+                    if index >= len(self.items):
+                        return
+                    item = self.items[index]
+                index += 1
+                yield item
+        finally:
+            self.release()
+
+    def release(self):
+        with self._cond:
+            self.readers -= 1
+            if self.readers == 0 and not self.done:
+                # Nobody is waiting for the rest; new requests start afresh
+                self.abandoned = True
+                if _flights.get(self.key) is self:
+                    del _flights[self.key]
+
+
+def _coalesce(key, start):
+    """
+    (iterator over the live items for `key`, whether this request leads the
+    generation). Joins the in-flight generation for `key` or starts one
+    with `start()`, which returns an iterator, or None when there is too
+    little content; then the iterator is None too.
+    """
+    if COALESCE_POLICY == "off":
+        return start(), True
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight(key, start)
+        flight.readers += 1
+        flight.joined += 1
+
+        _coalesce_stats["requests"] += 1
+        _coalesce_stats["flights"] += leader
+        _coalesce_stats["coalesced"] += not leader
+        _coalesce_stats["max_readers"] = max(_coalesce_stats["max_readers"], flight.joined)
+
+    if leader:
+        threading.Thread(target=flight.run, name="generation-flight", daemon=True).start()
+
+    flight.ready.wait()
+    if flight.insufficient:
+        flight.release()
+        return None, leader
+    return flight.read(), leader
+
+
+def _personalise(mcq: Dict, rng: random.Random) -> Dict:
+    """The MCQ with its options in a per-user order."""
+    order = list(range(len(mcq["options"])))
+    rng.shuffle(order)
+    return {
+        **mcq,
+        "options": [mcq["options"][i] for i in order],
+        "correct_index": order.index(mcq["correct_index"])
+    }
+
+
+def _user_rng(user_id, key) -> random.Random:
+    return random.Random(f"{user_id}:{key}")
+
+
+def coalescing_stats() -> Dict:
+    with _flights_lock:
+        stats = dict(_coalesce_stats)
+        stats["in_flight"] = len(_flights)
+    stats["policy"] = COALESCE_POLICY
+    stats["coalescing_ratio"] = round(stats["coalesced"] / stats["requests"], 3) if stats["requests"] else None
+    return stats
+
+
 # ======================================================
 # PUBLIC API: MCQs
 # ======================================================
 
-def generate_quiz(subject_id: int, unit_id: int, difficulty: str = "medium") -> Dict:
+def generate_quiz(subject_id: int, unit_id: int, difficulty: str = "medium", user_id=None) -> Dict:
+    result = stream_quiz(subject_id, unit_id, difficulty, user_id=user_id, per_call=None)
+    if result["success"]:
+        questions = list(result["questions"])
+        if result.pop("coalesced") and COALESCE_POLICY == "shuffle":
+            # The order is free once the whole quiz is there
+            _user_rng(user_id, (subject_id, unit_id, difficulty)).shuffle(questions)
+        result["questions"] = questions
+    return result
+
+
+def stream_quiz(
+    subject_id: int,
+    unit_id: int,
+    difficulty: str = "medium",
+    user_id=None,
+    per_call: Optional[int] = MCQ_STREAM_BATCH
+) -> Dict:
+    """
+    Like generate_quiz, but "questions" is an iterator that yields each
+    question as soon as it is ready: banked ones at once, live ones as
+    their calls return. "total" is the number asked for; fewer may come.
+    "coalesced" tells whether the live questions were shared with an
+    identical concurrent request.
+    """
     if not RAG_AVAILABLE:
         return _empty_quiz("Document service not available")
 
     count = DIFFICULTY_QUESTION_COUNT.get(difficulty, 8)
-    chunks = _get_chunks(subject_id, unit_id, top_k=40)
 
-    context = " ".join(c.get("text", "") for c in chunks if c.get("text"))
-    if len(context) < 200:
-        return _empty_quiz("Insufficient content")
-
-    questions = []
-    for _ in range(count):
-        mcq = _generate_mcq_from_context(context)
-        if mcq:
-            questions.append(mcq)
+    # Pre-generated questions first; live generation only fills the gap
+    banked = question_bank.take(subject_id, unit_id, difficulty, count)
+    missing = count - len(banked)
+    live, coalesced = None, False
+    if missing > 0:
+        # Only requests short by the same number of questions share a generation
+        live, leader = _coalesce(
+            ("quiz", subject_id, unit_id, difficulty, per_call, missing),
+            lambda: stream_questions(subject_id, unit_id, missing, per_call, difficulty=difficulty)
+        )
+        if live is None and not banked:
+            return _empty_quiz("Insufficient content")
+        coalesced = live is not None and not leader
+        if coalesced and COALESCE_POLICY == "shuffle":
+            rng = _user_rng(user_id, (subject_id, unit_id, difficulty))
+            live = _shuffled_options(live, rng)
 
     return {
         "success": True,
         "difficulty": difficulty,
-        "questions": questions
+        "total": count,
+        "coalesced": coalesced,
+        "questions": _merge_questions(banked, live, count)
     }
 
 
+def _shuffled_options(questions: Iterator[Dict], rng: random.Random) -> Iterator[Dict]:
+    try:
+        for mcq in questions:
+            yield _personalise(mcq, rng)
+    finally:
+        questions.close()
+
+
+def _merge_questions(banked: List[Dict], live: Optional[Iterator[Dict]], count: int) -> Iterator[Dict]:
+    yield from banked
+    if live is None:
+        return
+
+    keys = {question_key(q["question"]) for q in banked}
+    produced = len(banked)
+    try:
+        for q in live:
+            if question_key(q["question"]) in keys:
+                continue
+            produced += 1
+            yield q
+            # Don't wait for another item the quiz has no room for
+            if produced >= count:
+                break
+    finally:
+        # Stops outstanding calls when the quiz is full or the client left
+        live.close()
+
+
+def generate_questions(
+    subject_id: int,
+    unit_id: int,
+    count: int,
+    difficulty: str = "medium",
+    background: bool = False
+):
+    """
+    Up to `count` validated MCQs of `difficulty` generated live from the
+    unit's material, or None when the unit has too little content to
+    generate from. `background` runs the calls on the background pool
+    (capped below live requests).
+    """
+    questions = stream_questions(
+        subject_id, unit_id, count,
+        pool=background_pool if background else llm_pool,
+        difficulty=difficulty
+    )
+    return None if questions is None else list(questions)
+
+
+def stream_questions(
+    subject_id: int,
+    unit_id: int,
+    count: int,
+    per_call: Optional[int] = None,
+    pool: LLMPool = llm_pool,
+    difficulty: str = "medium"
+):
+    """
+    Iterator over up to `count` validated MCQs of `difficulty`, generated
+    live as it is consumed on `pool`; batched mode asks for `per_call`
+    questions per call (all in one call by default). None when the unit has
+    too little content.
+    """
+    calls = -(-count // (per_call or count))
+    if MCQ_GENERATION == "batch":
+        # A slice per call, one more for a top-up
+        budget = MCQ_BATCH_CONTEXT_TOKENS if calls == 1 else MCQ_CONTEXT_TOKENS
+        contexts = _get_contexts(subject_id, unit_id, budget, prompts=calls + MCQ_TOP_UP_ROUNDS)
+    else:
+        contexts = _get_contexts(subject_id, unit_id, MCQ_CONTEXT_TOKENS, prompts=count)
+
+    if not contexts or len(contexts[0]["text"]) < 200:
+        return None
+
+    deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+    if MCQ_GENERATION == "batch":
+        return _iter_batched(contexts, count, per_call or count, deadline, pool, difficulty)
+
+    # Per-question calls run concurrently; first `count` valid ones win
+    seen = set()
+    return pool.stream(
+        [lambda text=c["text"]: _generate_mcq_from_context(text, difficulty) for c in contexts],
+        want=count,
+        validate=lambda mcq: _validate_mcq(mcq, seen),
+        deadline=deadline
+    )
+
+
 # ======================================================
 # PUBLIC API: FLASHCARDS
 # ======================================================
 
-def generate_flashcards(subject_id: int, unit_id: int, difficulty: str = "medium") -> Dict:
+def generate_flashcards(subject_id: int, unit_id: int, difficulty: str = "medium", user_id=None) -> Dict:
     if not RAG_AVAILABLE:
         return {"success": False, "flashcards": []}
 
     count = FLASHCARD_COUNT.get(difficulty, 8)
-    chunks = _get_chunks(subject_id, unit_id, top_k=30)
-
-    context = " ".join(c.get("text", "") for c in chunks if c.get("text"))
-    if len(context) < 200:
+    live, leader = _coalesce(
+        ("flashcards", subject_id, unit_id, difficulty),
+        lambda: _stream_flashcards(subject_id, unit_id, count)
+    )
+    if live is None:
         return {"success": False, "flashcards": []}
 
-    flashcards = _generate_flashcards_from_context(context, count)
+    flashcards = list(next(live, []))
+    live.close()
+    if not leader and COALESCE_POLICY == "shuffle":
+        _user_rng(user_id, (subject_id, unit_id, difficulty)).shuffle(flashcards)
 
     return {
         "success": True,
@@ -228,16 +701,29 @@ def generate_flashcards(subject_id: int, unit_id: int, difficulty: str = "medium
     }
 
 
+def _stream_flashcards(subject_id: int, unit_id: int, count: int):
+    """Iterator yielding the flashcard list once generated, or None when the unit has too little content."""
+    contexts = _get_contexts(subject_id, unit_id, FLASHCARD_CONTEXT_TOKENS)
+
+    if not contexts or len(contexts[0]["text"]) < 200:
+        return None
+
+    text = contexts[0]["text"]
+    return llm_pool.stream([lambda: _generate_flashcards_from_context(text, count)])
+
+
 # ======================================================
 # HELPERS
 # ======================================================
 
-def _get_chunks(subject_id: int, unit_id: int, top_k: int = 20):
+def _get_contexts(subject_id: int, unit_id: int, token_budget: int, prompts: int = 1):
     try:
-        return rag_service.retrieve_context(
+        return context_assembler.assemble(
             subject_id=subject_id,
             unit_id=unit_id,
-            top_k=top_k
+            token_budget=token_budget,
+            prompts=prompts,
+            source=CONTEXT_SOURCE
         )
     except Exception:
         return []
@@ -255,4 +741,7 @@ def _empty_quiz(message: str) -> Dict:
 # EXPORTS
 # ======================================================
 
-__all__ = ["generate_quiz", "generate_flashcards"]
+__all__ = [
+    "generate_quiz", "stream_quiz", "generate_questions", "generate_flashcards",
+    "llm_stats", "coalescing_stats"
+]
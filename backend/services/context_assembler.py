@@ -0,0 +1,205 @@
+"""
+Context Assembler
+Packs retrieved chunks into prompt contexts that fit a token budget.
+
+Only as many chunks as the prompts can hold are retrieved: one retrieval
+covers every prompt of a request, and each prompt gets its own slice of the
+chunks (rotating over them when the unit is small), instead of every prompt
+re-reading the same prefix of one large joined string. The last chunk of a
+slice is cut at a word boundary to use up the budget. Token counts are
+estimated from characters, conservatively, since the generation model's
+tokenizer is not available here. Retrieval and packing time are recorded.
+
+With source="digest" prompts are packed from the unit's digest sentences
+(see unit_digest) rather than raw chunks, so the same budget carries more
+distinct material; units whose digest is too thin fall back to chunks.
+The digest is deterministic, so each request shuffles it within each
+priority group (concepts stay first): repeated quizzes and question-bank
+refills see different sentences instead of the same leading slice.
+"""
+
+import math
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List
+
+from backend.services.rag_service import rag_service
+from backend.services.text_pipeline import CHUNK_SIZE
+
+# ---------------- CONFIG ----------------
+
+# Llama / GPT tokenizers average ~4 characters per token on English text;
+# estimating with fewer characters per token keeps prompts under budget
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", 3.5))
+
+# A cut chunk shorter than this is not worth its place in the prompt
+MIN_TAIL_TOKENS = 40
+
+# Units with a smaller digest are packed from raw chunks instead
+MIN_DIGEST_TOKENS = int(os.getenv("MIN_DIGEST_TOKENS", 300))
+
+CONTEXT_SOURCES = ("digest", "chunks")
+
+SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = int(tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip()
+
+
+def sample_by_priority(items: List[Dict]) -> List[Dict]:
+    """`items` in a fresh random order within each priority group, highest first."""
+    groups: Dict[int, List[Dict]] = {}
+    for item in items:
+        groups.setdefault(item["priority"], []).append(item)
+    sampled = []
+    for priority in sorted(groups, reverse=True):
+        group = groups[priority]
+        random.shuffle(group)
+        sampled.extend(group)
+    return sampled
+
+
+class ContextAssembler:
+    def __init__(
+        self,
+        retrieve: Callable[..., List[Dict]],
+        digest: Callable[[int, int], List[Dict]]
+    ):
+        self.retrieve = retrieve
+        self.digest = digest
+        self._lock = threading.Lock()
+
+        self.assemblies = 0
+        self.digest_assemblies = 0
+        self.prompts = 0
+        self.chunks_retrieved = 0
+        self.chunks_used = 0
+        self.tokens_packed = 0
+        self.tokens_budgeted = 0
+        self.retrieve_seconds = 0.0
+        self.pack_seconds = 0.0
+        self.max_seconds = 0.0
+
+    # ---------- ASSEMBLY ----------
+
+    def assemble(
+        self,
+        subject_id: int,
+        unit_id: int,
+        token_budget: int,
+        prompts: int = 1,
+        query: str = "",
+        source: str = "chunks"
+    ) -> List[Dict]:
+        """
+        `prompts` contexts of at most `token_budget` (estimated) tokens each,
+        as {"text", "tokens", "chunk_ids"}. Empty when the unit has no chunks.
+        """
+        if source not in CONTEXT_SOURCES:
+            raise ValueError(f"Unknown context source: {source} (expected one of {', '.join(CONTEXT_SOURCES)})")
+
+        t0 = time.perf_counter()
+        items = []
+        if source == "digest" and not query:
+            items = self.digest(subject_id, unit_id)
+            if sum(estimate_tokens(item["text"]) for item in items) < MIN_DIGEST_TOKENS:
+                items = []
+            items = sample_by_priority(items)
+        if not items:
+            source = "chunks"
+            per_prompt = token_budget // estimate_tokens("x" * CHUNK_SIZE) + 1
+            items = [
+                c for c in self.retrieve(subject_id, unit_id, query=query, top_k=per_prompt * prompts)
+                if c.get("text")
+            ]
+        t1 = time.perf_counter()
+        contexts = self.pack(items, token_budget, prompts) if items else []
+        t2 = time.perf_counter()
+
+        self._record(prompts, token_budget, source, items, contexts, t1 - t0, t2 - t1)
+        if contexts:
+            print(
+                f"🧩 Context assembled: {len(contexts)} prompts from {len(items)} {source} items, "
+                f"{sum(c['tokens'] for c in contexts)}/{token_budget * len(contexts)} tokens, "
+                f"{(t2 - t0) * 1000:.1f} ms"
+            )
+        return contexts
+
+    @staticmethod
+    def pack(chunks: List[Dict], token_budget: int, prompts: int) -> List[Dict]:
+        """Fill each prompt's budget from its own slice of `chunks` (or digest sentences)."""
+        tokens = [estimate_tokens(c["text"]) for c in chunks]
+        sep_tokens = estimate_tokens(SEPARATOR)
+        stride = max(1, len(chunks) // prompts)
+
+        contexts = []
+        for p in range(prompts):
+            parts, chunk_ids, used = [], [], 0
+            for j in range(len(chunks)):
+                i = (p * stride + j) % len(chunks)
+                cost = tokens[i] + (sep_tokens if parts else 0)
+                if used + cost <= token_budget:
+                    parts.append(chunks[i]["text"])
+                    chunk_ids.append(chunks[i]["chunk_id"])
+                    used += cost
+                    continue
+
+                remaining = token_budget - used - (sep_tokens if parts else 0)
+                if remaining >= MIN_TAIL_TOKENS:
+                    tail = truncate_to_tokens(chunks[i]["text"], remaining)
+                    parts.append(tail)
+                    chunk_ids.append(chunks[i]["chunk_id"])
+                    used += estimate_tokens(tail) + (sep_tokens if len(parts) > 1 else 0)
+                break
+
+            contexts.append({"text": SEPARATOR.join(parts), "tokens": used, "chunk_ids": chunk_ids})
+        return contexts
+
+    # ---------- METRICS ----------
+
+    def _record(self, prompts, token_budget, source, chunks, contexts, retrieve_s, pack_s):
+        used = {chunk_id for c in contexts for chunk_id in c["chunk_ids"]}
+        if source == "digest":
+            # Digest sentences share chunk ids; count the chunks they came from
+            chunks = {item["chunk_id"] for item in chunks}
+        with self._lock:
+            self.assemblies += 1
+            self.digest_assemblies += source == "digest"
+            self.prompts += prompts
+            self.chunks_retrieved += len(chunks)
+            self.chunks_used += len(used)
+            self.tokens_packed += sum(c["tokens"] for c in contexts)
+            self.tokens_budgeted += token_budget * prompts
+            self.retrieve_seconds += retrieve_s
+            self.pack_seconds += pack_s
+            self.max_seconds = max(self.max_seconds, retrieve_s + pack_s)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            n = self.assemblies
+            return {
+                "assemblies": n,
+                "digest_assemblies": self.digest_assemblies,
+                "prompts": self.prompts,
+                "chunks_retrieved": self.chunks_retrieved,
+                "chunks_used": self.chunks_used,
+                "chunk_use_rate": self.chunks_used / self.chunks_retrieved if self.chunks_retrieved else None,
+                "budget_use_rate": self.tokens_packed / self.tokens_budgeted if self.tokens_budgeted else None,
+                "retrieve_ms_avg": round(self.retrieve_seconds * 1000 / n, 3) if n else None,
+                "pack_ms_avg": round(self.pack_seconds * 1000 / n, 3) if n else None,
+                "assemble_ms_max": round(self.max_seconds * 1000, 3)
+            }
+
+
+context_assembler = ContextAssembler(rag_service.retrieve_context, rag_service.unit_digest)
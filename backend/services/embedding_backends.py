@@ -0,0 +1,166 @@
+"""
+Embedding Backends
+Pluggable engines that turn chunk text into vectors for the FAISS index.
+
+  openai   text-embedding-3-small through BatchEmbedder (network, cached)
+  local    hashed word / bigram / character-trigram TF vectors in NumPy;
+           no network, no API key, so the index is always searchable
+
+Vectors from different backends are not comparable, so the segment store
+records which backend built the index and RAGService keeps using it.
+"""
+
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.services.embedding_pipeline import BatchEmbedder
+
+# ---------------- CONFIG ----------------
+
+# "auto" picks openai when OPENAI_API_KEY is set, local otherwise
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto").strip().lower()
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+
+# ---------------- OPENAI CLIENT ----------------
+
+_openai_client = None
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+        # Retries and backoff are handled per batch by BatchEmbedder
+        _openai_client = OpenAI(max_retries=0)
+    return _openai_client
+
+
+# ---------------- BASE ----------------
+
+class EmbeddingBackend:
+    name = ""
+    # Whether vectors are worth persisting in the embedding cache
+    cacheable = False
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (vectors, ok); rows that could not be embedded are flagged False."""
+        raise NotImplementedError
+
+
+# ---------------- OPENAI ----------------
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    name = f"openai:{OPENAI_EMBEDDING_MODEL}"
+    cacheable = True
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self.embedder = BatchEmbedder(self._embed_batch, dim)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = get_openai_client().embeddings.create(
+            model=OPENAI_EMBEDDING_MODEL,
+            input=texts
+        )
+        return [item.embedding for item in response.data]
+
+    def embed(self, texts, progress=None):
+        return self.embedder.embed(texts, progress)
+
+
+# ---------------- LOCAL ----------------
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were which with will can not but all any each other than then
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Feature hashing of word unigrams, word bigrams and character trigrams,
+    with sublinear term frequency and a signed hash to cancel collisions.
+    Vectors are L2-normalised, so L2 distance ranks like cosine similarity.
+    """
+
+    name = "local:hash-ngram-v1"
+
+    def _features(self, text: str) -> Counter:
+        words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+        features = Counter(words)
+        features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for w in words:
+            padded = f"#{w}#"
+            features.update(f"~{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed_one(self, text: str) -> np.ndarray:
+        features = self._features(text)
+        vector = np.zeros(self.dim, dtype="float32")
+        if not features:
+            return vector
+
+        hashes = np.fromiter(
+            (zlib.crc32(f.encode("utf-8")) for f in features),
+            dtype="uint64",
+            count=len(features)
+        )
+        weights = np.fromiter(
+            (1.0 + math.log(c) for c in features.values()),
+            dtype="float32",
+            count=len(features)
+        )
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype("float32")
+        np.add.at(vector, (hashes % self.dim).astype("int64"), signs * weights)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed(self, texts, progress=None):
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            vectors[i] = self.embed_one(text)
+            if progress and ((i + 1) % 256 == 0 or i + 1 == len(texts)):
+                progress(i + 1, len(texts))
+        return vectors, np.ones(len(texts), dtype=bool)
+
+
+# ---------------- FACTORY ----------------
+
+BACKENDS = {
+    OpenAIEmbeddingBackend.name: OpenAIEmbeddingBackend,
+    LocalEmbeddingBackend.name: LocalEmbeddingBackend,
+}
+
+ALIASES = {
+    "openai": OpenAIEmbeddingBackend.name,
+    "local": LocalEmbeddingBackend.name,
+}
+
+
+def resolve_backend_name(name: str = EMBEDDING_BACKEND) -> str:
+    if name == "auto":
+        return ALIASES["openai"] if os.getenv("OPENAI_API_KEY") else ALIASES["local"]
+    return ALIASES.get(name, name)
+
+
+def get_embedding_backend(name: str, dim: int) -> EmbeddingBackend:
+    name = resolve_backend_name(name)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    return BACKENDS[name](dim)
@@ -0,0 +1,73 @@
+"""
+Embedding Cache
+Persistent chunk-text-hash -> embedding store, shared by all workers.
+
+Identical chunks (re-uploaded or overlapping workbooks) are embedded once;
+every later request for the same text and model is served from SQLite.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+
+def text_hash(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.model = model
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " hash TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL"
+            ")"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not cross threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        hashes = [text_hash(self.model, t) for t in texts]
+        found = {}
+
+        conn = self._conn()
+        unique = list(set(hashes))
+        for i in range(0, len(unique), 500):
+            batch = unique[i:i + 500]
+            rows = conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype="float32")
+
+        return [found.get(h) for h in hashes]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (hash, vector) VALUES (?, ?)",
+            [
+                (text_hash(self.model, t), np.asarray(v, dtype="float32").tobytes())
+                for t, v in zip(texts, vectors)
+            ]
+        )
+        conn.commit()
@@ -0,0 +1,190 @@
+"""
+Embedding Pipeline
+Bounded-concurrency, rate-aware batching for embedding API calls.
+
+Batches are dispatched to a small thread pool. Requests and tokens are both
+metered by token buckets so bursts stay inside the provider's limits. Each
+batch is retried with exponential backoff, and the batch size adapts: it
+shrinks when the API pushes back and grows again while calls succeed. A
+batch that still fails after its retries only loses its own rows.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_MIN_BATCH = 4
+EMBEDDING_MAX_BATCH = 256
+EMBEDDING_RPM = float(os.getenv("EMBEDDING_RPM", 3000))
+EMBEDDING_TPM = float(os.getenv("EMBEDDING_TPM", 1_000_000))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 4))
+EMBEDDING_BACKOFF_SECONDS = 0.5
+
+# HTTP statuses that mean "slow down" rather than "this batch is bad"
+THROTTLE_STATUSES = {408, 409, 413, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Throttling, server errors and network blips are retried; bad requests are not."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in THROTTLE_STATUSES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+# ---------------- TOKEN BUCKET ----------------
+
+class TokenBucket:
+    """Refills at `rate_per_minute`; acquire() blocks until enough is available."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_s = (amount - self.tokens) / self.rate
+            time.sleep(min(wait_s, 1.0))
+
+
+# ---------------- BATCH EMBEDDER ----------------
+
+class BatchEmbedder:
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        dim: int,
+        max_workers: int = EMBEDDING_CONCURRENCY,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        requests_per_minute: float = EMBEDDING_RPM,
+        tokens_per_minute: float = EMBEDDING_TPM,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        adaptive: bool = True
+    ):
+        self.embed_fn = embed_fn
+        self.dim = dim
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.adaptive = adaptive
+
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._size_lock = threading.Lock()
+
+    # ---------- ADAPTIVE BATCH SIZE ----------
+
+    def _shrink(self):
+        if not self.adaptive:
+            return
+        with self._size_lock:
+            self.batch_size = max(EMBEDDING_MIN_BATCH, self.batch_size // 2)
+
+    def _grow(self):
+        if not self.adaptive:
+            return
+        with self._size_lock:
+            self.batch_size = min(EMBEDDING_MAX_BATCH, self.batch_size + max(1, self.batch_size // 4))
+
+    # ---------- ONE BATCH ----------
+
+    def _run_batch(self, batch: List[str], abort: threading.Event) -> Optional[np.ndarray]:
+        tokens = sum(estimate_tokens(t) for t in batch)
+
+        for attempt in range(self.max_retries + 1):
+            if abort.is_set():
+                return None
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            try:
+                vectors = np.array(self.embed_fn(batch), dtype="float32")
+                if vectors.shape != (len(batch), self.dim):
+                    raise ValueError(f"unexpected embedding shape {vectors.shape}")
+                self._grow()
+                return vectors
+            except Exception as e:
+                if not is_retryable(e):
+                    # Misconfiguration or a rejected request: stop the whole run
+                    print("⚠️ Embedding error:", e)
+                    abort.set()
+                    return None
+                self._shrink()
+                if attempt == self.max_retries:
+                    print(f"⚠️ Embedding batch failed after {attempt + 1} attempts:", e)
+                    return None
+                delay = EMBEDDING_BACKOFF_SECONDS * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+
+    # ---------- PUBLIC ----------
+
+    def embed(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Embed `texts`, returning (vectors, ok). Rows whose batch failed are
+        zero and flagged False in `ok`; everything else is kept.
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        ok = np.zeros(len(texts), dtype=bool)
+        if not texts:
+            return vectors, ok
+
+        done = 0
+        next_start = 0
+        in_flight = {}
+        abort = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as pool:
+            while next_start < len(texts) or in_flight:
+                while next_start < len(texts) and len(in_flight) < self.max_workers:
+                    if abort.is_set():
+                        next_start = len(texts)
+                        break
+                    end = min(len(texts), next_start + self.batch_size)
+                    future = pool.submit(self._run_batch, texts[next_start:end], abort)
+                    in_flight[future] = (next_start, end)
+                    next_start = end
+
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, end = in_flight.pop(future)
+                    result = future.result()
+                    if result is not None:
+                        vectors[start:end] = result
+                        ok[start:end] = True
+                    done += end - start
+                    if progress:
+                        progress(done, len(texts))
+
+        return vectors, ok
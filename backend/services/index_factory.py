@@ -0,0 +1,203 @@
+"""
+Index Factory
+Builds the FAISS index for a segment and the search parameters to query it.
+
+Index type (RAG_INDEX_TYPE):
+  flat    exact scan over every vector
+  ivf     k-means coarse quantizer, trained per segment; searches
+          RAG_IVF_NPROBE of its lists
+  hnsw    graph index; RAG_HNSW_EF_SEARCH trades recall for latency
+
+Vector storage (RAG_VECTOR_STORAGE), optionally after a PCA projection to
+RAG_PCA_DIM dimensions:
+  float32 full precision, 6 KB per 1536-dim vector
+  fp16    half precision, 2x smaller
+  sq8     8-bit scalar quantisation, 4x smaller
+  pq      product quantisation, RAG_PQ_M bytes per vector
+
+Indexes are composed with faiss.index_factory and wrapped in IndexIDMap2,
+so segments address vectors by chunk id whatever the type. Compressed or
+projected indexes are lossy: their candidates are re-ranked exactly against
+the segment's float32 vectors file. Segments too small for an approximate
+index, PQ or PCA training to pay off are built flat (PQ becomes SQ8).
+The index settings are recorded in the manifest; switching them goes
+through the rebuild script.
+"""
+
+import math
+import os
+
+import faiss
+import numpy as np
+
+# ---------------- CONFIG ----------------
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+VECTOR_STORAGES = ("float32", "fp16", "sq8", "pq")
+
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat").strip().lower()
+VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "float32").strip().lower()
+# 0 keeps the embedding dimension
+PCA_DIM = int(os.getenv("RAG_PCA_DIM", 0))
+
+# Below this many vectors an exact scan is as fast as any ANN index
+ANN_MIN_VECTORS = int(os.getenv("RAG_ANN_MIN_VECTORS", 10000))
+
+# 0 picks about 4 * sqrt(n) lists
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", 0))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", 16))
+# k-means wants this many training points per centroid
+IVF_MIN_POINTS_PER_LIST = 39
+
+HNSW_M = int(os.getenv("RAG_HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", 128))
+
+# PQ sub-quantizers (bytes per vector); 0 picks dim / 16
+PQ_M = int(os.getenv("RAG_PQ_M", 0))
+
+# Lossy indexes fetch this many candidates per result for exact re-ranking
+RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", 4))
+
+# Quantizer / PCA training uses at most this many vectors
+TRAIN_SAMPLE = 100000
+
+
+def index_spec(
+    index_type: str = INDEX_TYPE,
+    storage: str = VECTOR_STORAGE,
+    pca_dim: int = PCA_DIM
+) -> dict:
+    """Validated index settings, as recorded in the manifest."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+    if storage not in VECTOR_STORAGES:
+        raise ValueError(f"Unknown vector storage: {storage} (expected one of {', '.join(VECTOR_STORAGES)})")
+    return {"index_type": index_type, "vector_storage": storage, "pca_dim": int(pca_dim)}
+
+
+# ---------------- BUILD ----------------
+
+def _pq_m(dim: int) -> int:
+    m = PQ_M or max(1, dim // 16)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(
+    dim: int,
+    n: int,
+    index_type: str,
+    storage: str,
+    pca_dim: int,
+    min_vectors: int = ANN_MIN_VECTORS
+) -> str:
+    """faiss.index_factory description for a segment of `n` vectors."""
+    if n < min_vectors:
+        index_type, pca_dim = "flat", 0
+        storage = "sq8" if storage == "pq" else storage
+
+    parts = ["IDMap2"]
+    if pca_dim and pca_dim < dim:
+        parts.append(f"PCA{pca_dim}")
+        dim = pca_dim
+
+    codes = {"float32": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{_pq_m(dim)}"}[storage]
+
+    if index_type == "ivf":
+        nlist = IVF_NLIST or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // IVF_MIN_POINTS_PER_LIST))
+        parts += [f"IVF{nlist}", codes]
+    elif index_type == "hnsw":
+        parts.append(f"HNSW{HNSW_M}" + ("" if storage == "float32" else f"_{codes}"))
+    elif storage == "pq":
+        # IndexPQ ignores search parameters; one IVF list is the same scan with selectors
+        parts += ["IVF1", codes]
+    else:
+        parts.append(codes)
+    return ",".join(parts)
+
+
+def build_index(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    dim: int,
+    index_type: str = INDEX_TYPE,
+    vector_storage: str = VECTOR_STORAGE,
+    pca_dim: int = PCA_DIM,
+    min_vectors: int = ANN_MIN_VECTORS
+) -> faiss.Index:
+    """Index `vectors` under `ids` with the requested settings."""
+    index_spec(index_type, vector_storage, pca_dim)
+    index = faiss.index_factory(
+        dim, factory_string(dim, len(vectors), index_type, vector_storage, pca_dim, min_vectors)
+    )
+
+    if not index.is_trained:
+        train = vectors
+        if len(vectors) > TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            train = vectors[np.sort(rng.choice(len(vectors), TRAIN_SAMPLE, replace=False))]
+        index.train(train)
+
+    base = _base(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+# ---------------- INSPECT ----------------
+
+def _unwrap(index: faiss.Index):
+    """(innermost index, whether a PCA / pre-transform sits in front of it)."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index), True
+    return index, False
+
+
+def _base(index: faiss.Index) -> faiss.Index:
+    return _unwrap(index)[0]
+
+
+def index_kind(index: faiss.Index) -> str:
+    """The factory type an index (possibly loaded from disk) was built as."""
+    base = _base(index)
+    if isinstance(base, faiss.IndexIVF) and base.nlist > 1:
+        return "ivf"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def is_exact(index: faiss.Index) -> bool:
+    """Whether distances are computed on the original float32 vectors."""
+    base, transformed = _unwrap(index)
+    return not transformed and isinstance(
+        base, (faiss.IndexFlat, faiss.IndexHNSWFlat, faiss.IndexIVFFlat)
+    )
+
+
+# ---------------- SEARCH ----------------
+
+def search_parameters(index: faiss.Index, selector=None, k: int = 1) -> faiss.SearchParameters:
+    """Search parameters for `index`, restricted to `selector` when given."""
+    base = _base(index)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(IVF_NPROBE, base.nlist))
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=max(HNSW_EF_SEARCH, k))
+    return faiss.SearchParameters(sel=selector)
+
+
+def exact_rerank(query: np.ndarray, ids: np.ndarray, vectors: np.ndarray, k: int):
+    """Re-order candidate `ids` by exact squared L2 distance to `query`."""
+    distances = ((np.asarray(vectors, dtype="float32") - query.reshape(1, -1)) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return distances[order], ids[order]
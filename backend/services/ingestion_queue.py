@@ -0,0 +1,295 @@
+"""
+Ingestion Queue
+Background processing of uploaded PDFs, tracked in the ingestion_jobs table.
+
+The upload request only saves the file and queues a job; a small thread pool
+in the same process parses, embeds and indexes it, writing stage and counters
+back to the job row so /admin/jobs/<id> can report progress. A job is claimed
+with a conditional UPDATE, so it runs once even if several workers see it.
+
+A running job's heartbeat_at is touched every HEARTBEAT_INTERVAL seconds.
+A job still marked running without a heartbeat for STALE_JOB_SECONDS lost
+its worker (a restart or crash); it no longer counts as in flight, and is
+failed (hiding the chunks it had indexed) at startup, on the next submit,
+by any worker's heartbeat, or when its status is polled.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_
+
+from backend.models.database import SessionLocal, Document, IngestionJob, JobStatus
+from backend.services.question_bank import question_bank
+from backend.services.rag_service import rag_service
+from backend.services.text_pipeline import count_pdf_pages
+
+# ---------------- CONFIG ----------------
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+
+# Minimum seconds between progress writes for one job
+PROGRESS_INTERVAL = 1.0
+
+HEARTBEAT_INTERVAL = float(os.getenv("INGEST_HEARTBEAT_SECONDS", 15))
+STALE_JOB_SECONDS = float(os.getenv("INGEST_STALE_SECONDS", 120))
+
+
+def job_to_dict(job: IngestionJob) -> dict:
+    return {
+        "id": job.id,
+        "document_id": job.document_id,
+        "status": job.status,
+        "stage": job.stage,
+        "total_pages": job.total_pages,
+        "pages_parsed": job.pages_parsed,
+        "chunks_created": job.chunks_created,
+        "chunks_embedded": job.chunks_embedded,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def is_stale(job: IngestionJob) -> bool:
+    """A running job whose worker stopped sending heartbeats."""
+    last_seen = job.heartbeat_at or job.started_at
+    return job.status == JobStatus.RUNNING.value and (
+        last_seen is None
+        or datetime.utcnow() - last_seen > timedelta(seconds=STALE_JOB_SECONDS)
+    )
+
+
+def in_flight_filter():
+    """Jobs still queued, or running with a recent heartbeat."""
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS)
+    return or_(
+        IngestionJob.status == JobStatus.QUEUED.value,
+        and_(
+            IngestionJob.status == JobStatus.RUNNING.value,
+            func.coalesce(IngestionJob.heartbeat_at, IngestionJob.started_at) >= cutoff
+        )
+    )
+
+
+class IngestionQueue:
+    def __init__(self, max_workers: int = INGEST_WORKERS):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="ingest"
+                )
+            return self._pool
+
+    # ---------- PUBLIC ----------
+
+    def submit(self, job_id: int):
+        self._sweep()
+        self._executor().submit(self._run, job_id)
+
+    def resume_pending(self):
+        """
+        Fail jobs whose worker died mid-run, then queue jobs left waiting by
+        a previous process (claiming keeps this safe).
+        """
+        self.fail_stale()
+
+        db = SessionLocal()
+        try:
+            job_ids = [
+                job_id for (job_id,) in db.query(IngestionJob.id).filter(
+                    IngestionJob.status == JobStatus.QUEUED.value
+                )
+            ]
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            self.submit(job_id)
+        if job_ids:
+            print(f"📥 Resumed {len(job_ids)} queued ingestion jobs")
+
+    def fail_stale(self) -> int:
+        """
+        Mark running jobs without a recent heartbeat as failed. Their
+        documents were partly indexed, so those chunks are tombstoned; a
+        re-upload indexes the file from scratch.
+        """
+        db = SessionLocal()
+        try:
+            stale = db.query(IngestionJob).filter(
+                IngestionJob.status == JobStatus.RUNNING.value
+            ).filter(~in_flight_filter()).all()
+
+            failed = []
+            for job in stale:
+                # Conditional, in case another worker is failing it too
+                if db.query(IngestionJob).filter(
+                    IngestionJob.id == job.id,
+                    IngestionJob.status == JobStatus.RUNNING.value
+                ).update({
+                    "status": JobStatus.FAILED.value,
+                    "stage": JobStatus.FAILED.value,
+                    "error": "Worker stopped while processing; upload the file again",
+                    "finished_at": datetime.utcnow()
+                }, synchronize_session=False):
+                    failed.append((job.id, job.document_id))
+            db.commit()
+        finally:
+            db.close()
+
+        for job_id, document_id in failed:
+            print(f"💀 Ingestion job {job_id} lost its worker; marked failed")
+            if document_id:
+                rag_service.delete_document(document_id)
+        return len(failed)
+
+    def _sweep(self):
+        try:
+            self.fail_stale()
+        except Exception as e:
+            print("⚠️ Failing stale ingestion jobs failed:", e)
+
+    # ---------- WORKER ----------
+
+    def _claim(self, job_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            claimed = db.query(IngestionJob).filter(
+                IngestionJob.id == job_id,
+                IngestionJob.status == JobStatus.QUEUED.value
+            ).update({
+                "status": JobStatus.RUNNING.value,
+                "stage": "parsing",
+                "started_at": datetime.utcnow(),
+                "heartbeat_at": datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            return claimed == 1
+        finally:
+            db.close()
+
+    def _update(self, job_id: int, **fields):
+        db = SessionLocal()
+        try:
+            db.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+                fields, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: int, stop: threading.Event):
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self._update(job_id, heartbeat_at=datetime.utcnow())
+            except Exception as e:
+                print(f"⚠️ Heartbeat failed for ingestion job {job_id}:", e)
+            # Also catch jobs other (restarted) workers left behind
+            self._sweep()
+
+    def _run(self, job_id: int):
+        if not self._claim(job_id):
+            return
+
+        stop = threading.Event()
+        threading.Thread(
+            target=self._heartbeat, args=(job_id, stop), name=f"ingest-heartbeat-{job_id}", daemon=True
+        ).start()
+        try:
+            self._process(job_id)
+        finally:
+            stop.set()
+
+    def _process(self, job_id: int):
+        db = SessionLocal()
+        try:
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            document = job and db.query(Document).filter(Document.id == job.document_id).first()
+            if document:
+                file_path = document.file_path
+                subject_id, unit_id, document_id = job.subject_id, job.unit_id, document.id
+        finally:
+            db.close()
+
+        if not document:
+            self._fail(job_id, RuntimeError("Document was deleted before processing"))
+            return
+
+        self._update(job_id, total_pages=count_pdf_pages(file_path))
+
+        last_write = [0.0, None]
+
+        def progress(stage, pages, created, embedded):
+            now = time.monotonic()
+            if stage == last_write[1] and now - last_write[0] < PROGRESS_INTERVAL:
+                return
+            last_write[0], last_write[1] = now, stage
+            self._update(
+                job_id,
+                stage=stage,
+                pages_parsed=pages,
+                chunks_created=created,
+                chunks_embedded=embedded
+            )
+
+        print(f"⚙️ Ingestion job {job_id} started")
+        try:
+            chunk_count = rag_service.ingest_document(
+                file_path, subject_id, unit_id, document_id, progress=progress
+            )
+        except Exception as e:
+            self._fail(job_id, e)
+            return
+
+        db = SessionLocal()
+        try:
+            document = db.query(Document).filter(Document.id == document_id).first()
+            if document:
+                document.chunk_count = chunk_count
+                document.is_processed = chunk_count > 0
+
+            job = db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+            if not job:
+                # Document (and its job) deleted while processing
+                db.commit()
+                return
+            job.status = JobStatus.DONE.value if chunk_count > 0 else JobStatus.FAILED.value
+            job.stage = job.status
+            job.chunks_created = job.chunks_embedded = chunk_count
+            job.pages_parsed = max(job.pages_parsed or 0, job.total_pages or 0)
+            if not chunk_count:
+                job.error = "No text extracted from PDF"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            print(f"✅ Ingestion job {job_id} finished: {chunk_count} chunks")
+            if chunk_count:
+                question_bank.schedule_unit(subject_id, unit_id)
+        except Exception as e:
+            db.rollback()
+            self._fail(job_id, e)
+        finally:
+            db.close()
+
+    def _fail(self, job_id: int, error: Exception):
+        print(f"❌ Ingestion job {job_id} failed:", error)
+        self._update(
+            job_id,
+            status=JobStatus.FAILED.value,
+            stage=JobStatus.FAILED.value,
+            error=str(error),
+            finished_at=datetime.utcnow()
+        )
+
+
+ingestion_queue = IngestionQueue()
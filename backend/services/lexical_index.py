@@ -0,0 +1,166 @@
+"""
+Lexical Index
+BM25 over chunk text: one small inverted index per segment.
+
+Postings are built when a segment is written, so every ingest batch is
+searchable by keyword as soon as it is committed, and stored next to the
+segment as seg_XXXXXX.bm25.npz. Terms are kept as 64-bit hashes. Corpus
+statistics (chunk count, average length, document frequency) are summed
+over the segments searched at query time, so scores are comparable across
+a subject's shard. No network round trip is involved.
+"""
+
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+
+BM25_K1 = float(os.getenv("RAG_BM25_K1", 1.2))
+BM25_B = float(os.getenv("RAG_BM25_B", 0.75))
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in
+into is it its of on or that the their there these this those to was were
+what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        t for t in TOKEN.findall(text.lower())
+        if len(t) > 1 and t not in STOPWORDS
+    ]
+
+
+def term_hash(term: str) -> np.uint64:
+    return np.uint64(int.from_bytes(
+        hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little"
+    ))
+
+
+def query_terms(query: str) -> np.ndarray:
+    return np.unique(np.array([term_hash(t) for t in tokenize(query)], dtype=np.uint64))
+
+
+# ---------------- INDEX ----------------
+
+class LexicalIndex:
+    """
+    Postings of one segment in CSR form: the postings of `terms[i]` are
+    `positions[offsets[i]:offsets[i + 1]]` (local chunk positions, as in the
+    segment metadata) with term frequencies `tfs[...]`.
+    """
+
+    def __init__(
+        self,
+        terms: np.ndarray,
+        offsets: np.ndarray,
+        positions: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray
+    ):
+        self.terms = terms
+        self.offsets = offsets
+        self.positions = positions
+        self.tfs = tfs
+        self.lengths = lengths
+
+    @classmethod
+    def build(cls, texts: Sequence[str]) -> "LexicalIndex":
+        hashes: Dict[str, np.uint64] = {}
+        term_col, pos_col, tf_col = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.int32)
+
+        for pos, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[pos] = sum(counts.values())
+            for term, tf in counts.items():
+                h = hashes.get(term)
+                if h is None:
+                    h = hashes[term] = term_hash(term)
+                term_col.append(h)
+                pos_col.append(pos)
+                tf_col.append(tf)
+
+        term_col = np.array(term_col, dtype=np.uint64)
+        pos_col = np.array(pos_col, dtype=np.int32)
+        tf_col = np.array(tf_col, dtype=np.int32)
+
+        order = np.lexsort((pos_col, term_col))
+        term_col, pos_col, tf_col = term_col[order], pos_col[order], tf_col[order]
+        terms, starts = np.unique(term_col, return_index=True)
+        offsets = np.append(starts, len(term_col)).astype(np.int64)
+        return cls(terms, offsets, pos_col, tf_col, lengths)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "terms": self.terms,
+            "offsets": self.offsets,
+            "positions": self.positions,
+            "tfs": self.tfs,
+            "lengths": self.lengths
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays().values())
+
+    def postings(self, term: np.uint64) -> Tuple[np.ndarray, np.ndarray]:
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return self.positions[:0], self.tfs[:0]
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return self.positions[start:stop], self.tfs[start:stop]
+
+    def document_frequency(self, term: np.uint64) -> int:
+        return len(self.postings(term)[0])
+
+
+# ---------------- SEARCH ----------------
+
+def bm25_search(query: str, candidates: List[Tuple[LexicalIndex, np.ndarray, object]], k: int):
+    """
+    Top `k` chunks for `query` among `candidates`, a list of (index,
+    allowed local positions, tag). Returns [(score, tag, position)], best
+    first; chunks matching no query term are left out.
+    """
+    terms = query_terms(query)
+    if not len(terms) or not candidates:
+        return []
+
+    total = sum(len(index.lengths) for index, _, _ in candidates)
+    avg_length = max(1.0, sum(int(index.lengths.sum()) for index, _, _ in candidates) / max(1, total))
+    df = np.array([
+        sum(index.document_frequency(t) for index, _, _ in candidates) for t in terms
+    ], dtype=np.float64)
+    idf = np.log(1.0 + (total - df + 0.5) / (df + 0.5))
+
+    hits = []
+    for index, allowed, tag in candidates:
+        allowed_mask = np.zeros(len(index.lengths), dtype=bool)
+        allowed_mask[allowed] = True
+        scores = np.zeros(len(index.lengths), dtype=np.float64)
+
+        for term, weight in zip(terms, idf):
+            positions, tfs = index.postings(term)
+            keep = allowed_mask[positions]
+            positions, tfs = positions[keep], tfs[keep]
+            if not len(positions):
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * index.lengths[positions] / avg_length)
+            scores[positions] += weight * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        hits.extend((float(scores[pos]), tag, int(pos)) for pos in matched)
+
+    hits.sort(key=lambda h: -h[0])
+    return hits[:k]
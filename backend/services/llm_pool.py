@@ -0,0 +1,160 @@
+"""
+LLM Pool
+Bounded-concurrency fan-out for generation calls, with an overall deadline.
+
+Calls run on one small thread pool per worker process, so the number of
+Groq requests in flight is capped across all users of the worker, and each
+call first takes a token from a requests-per-minute bucket. stream() yields
+results as they complete (fan_out() collects them) and stops as soon as
+enough are valid or the deadline passes. Calls that have not started by
+then are dropped; calls already in flight finish in the background and
+their results are discarded.
+
+Background work (question-bank refills) goes through background_pool: its
+own single thread, so it never holds a slot live requests wait for, and a
+bucket of LLM_BACKGROUND_SHARE of the rate that it drains before taking
+tokens from the live bucket, so refills get at most that share of the
+requests per minute.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from backend.services.embedding_pipeline import TokenBucket
+
+# ---------------- CONFIG ----------------
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+# Groq's free tier allows 30 requests per minute per model
+LLM_RPM = float(os.getenv("LLM_RPM", 30))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", 25))
+
+# Share of LLM_RPM background generation may take, and its concurrency
+LLM_BACKGROUND_SHARE = float(os.getenv("LLM_BACKGROUND_SHARE", 0.25))
+LLM_BACKGROUND_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", 1))
+
+
+class LLMPool:
+    def __init__(
+        self,
+        max_workers: int = LLM_CONCURRENCY,
+        requests_per_minute: float = LLM_RPM,
+        parent: Optional["LLMPool"] = None,
+        name: str = "llm"
+    ):
+        self.max_workers = max_workers
+        self.request_bucket = TokenBucket(requests_per_minute)
+        # Calls also count against the parent's rate limit
+        self.parent = parent
+        self.name = name
+        self._pool = None
+        self._lock = threading.Lock()
+
+        self.fan_outs = 0
+        self.calls = 0
+        self.failed = 0
+        self.dropped = 0
+        self.deadline_hits = 0
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+            return self._pool
+
+    def _run(self, fn: Callable[[], Any], abandoned: threading.Event):
+        # Queued (behind other users' calls, or for the rate limit) until
+        # after the caller gave up
+        if not abandoned.is_set():
+            self.request_bucket.acquire(1)
+        if self.parent and not abandoned.is_set():
+            self.parent.request_bucket.acquire(1)
+        with self._lock:
+            if abandoned.is_set():
+                self.dropped += 1
+                return None
+            self.calls += 1
+        return fn()
+
+    # ---------- PUBLIC ----------
+
+    def stream(
+        self,
+        calls: List[Callable[[], Any]],
+        want: Optional[int] = None,
+        validate: Callable[[Any], Any] = lambda result: result,
+        deadline: Optional[float] = None
+    ) -> Iterator:
+        """
+        Run `calls` concurrently and yield the valid results in completion
+        order. `validate` runs in the consuming thread and maps a result to
+        the value to keep, or to a falsy value to drop it. Stops once
+        `want` results are kept or at `deadline` (a time.monotonic() value,
+        LLM_DEADLINE_SECONDS from now by default); closing the iterator
+        early abandons the remaining calls. A call that raises only loses
+        its own result.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+
+        abandoned = threading.Event()
+        pool = self._executor()
+        pending = {pool.submit(self._run, fn, abandoned) for fn in calls}
+        kept_count = 0
+
+        try:
+            while pending and (want is None or kept_count < want):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self.deadline_hits += 1
+                    print(f"⏱️ LLM deadline reached with {len(pending)} calls outstanding")
+                    break
+                finished, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print("⚠️ LLM call failed:", e)
+                        with self._lock:
+                            self.failed += 1
+                        continue
+                    kept = validate(result) if result else None
+                    if kept and (want is None or kept_count < want):
+                        kept_count += 1
+                        yield kept
+        finally:
+            abandoned.set()
+            dropped = sum(future.cancel() for future in pending)
+            with self._lock:
+                self.fan_outs += 1
+                self.dropped += dropped
+
+    def fan_out(self, calls: List[Callable[[], Any]], **kwargs) -> List:
+        """All of stream()'s results, once it stops."""
+        return list(self.stream(calls, **kwargs))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "fan_outs": self.fan_outs,
+                "calls": self.calls,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "deadline_hits": self.deadline_hits
+            }
+
+
+llm_pool = LLMPool()
+background_pool = LLMPool(
+    LLM_BACKGROUND_CONCURRENCY,
+    LLM_RPM * LLM_BACKGROUND_SHARE,
+    parent=llm_pool,
+    name="llm-background"
+)
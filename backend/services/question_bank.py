@@ -0,0 +1,310 @@
+"""
+Question Bank
+Pre-generated, validated MCQs per (unit, difficulty), so a quiz can start
+without waiting on the LLM.
+
+generate_quiz takes a quiz's worth of questions from the question_bank
+table; each question is served once. Whenever a bank is drawn from (and
+at startup, and after a unit's documents change) a background refiller
+tops it back up to QUESTION_BANK_DEPTH with the same generator live
+requests use. Live generation is only needed while a bank is empty or
+short. A question is claimed by deleting its row, so concurrent requests,
+also across workers, never serve the same question twice.
+
+Every worker schedules refills, so a refill first takes a lease on its bank
+(a question_bank_leases row, renewed per batch); other workers skip a
+leased bank. Inserts re-check the depth in their transaction. Refills run
+on the LLM background pool, which caps their share of the rate limit
+below live requests.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+
+from backend.models.database import SessionLocal, Document, QuestionBank, QuestionBankLease, Unit
+
+# ---------------- CONFIG ----------------
+
+QUESTION_BANK_DEPTH = int(os.getenv("QUESTION_BANK_DEPTH", 30))
+# Questions requested per generation call while refilling
+QUESTION_BANK_BATCH = int(os.getenv("QUESTION_BANK_BATCH", 10))
+QUESTION_BANK_WORKERS = int(os.getenv("QUESTION_BANK_WORKERS", 1))
+# A refill lease not renewed for this long is taken over by another worker
+QUESTION_BANK_LEASE_SECONDS = float(os.getenv("QUESTION_BANK_LEASE_SECONDS", 120))
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def question_key(question: str) -> str:
+    normalised = " ".join("".join(c if c.isalnum() else " " for c in question.lower()).split())
+    return hashlib.blake2b(normalised.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class QuestionBankService:
+    def __init__(self, max_workers: int = QUESTION_BANK_WORKERS):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        self.holder = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.started = time.time()
+
+        self.served = 0
+        self.short = 0
+        self.refills = 0
+        self.leased_elsewhere = 0
+        self.added = 0
+        self.refill_seconds = 0.0
+        self.last_refill = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="qbank"
+                )
+            return self._pool
+
+    # ---------- SERVING ----------
+
+    def take(self, subject_id: int, unit_id: int, difficulty: str, count: int) -> List[Dict]:
+        """
+        Claim up to `count` banked questions (fewer when the bank runs low)
+        and schedule a refill.
+        """
+        db = SessionLocal()
+        try:
+            candidates = db.query(QuestionBank.id, QuestionBank.question_data).filter(
+                QuestionBank.unit_id == unit_id,
+                QuestionBank.difficulty == difficulty
+            ).order_by(func.random()).limit(2 * count).all()
+
+            questions = []
+            for row_id, data in candidates:
+                if len(questions) == count:
+                    break
+                # Losing the race to another request deletes nothing
+                if db.query(QuestionBank).filter(QuestionBank.id == row_id).delete(synchronize_session=False):
+                    questions.append(json.loads(data))
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self.served += len(questions)
+            self.short += len(questions) < count
+        self.schedule(subject_id, unit_id, difficulty)
+        return questions
+
+    # ---------- REFILLING ----------
+
+    def schedule(self, subject_id: int, unit_id: int, difficulty: str):
+        key = (subject_id, unit_id, difficulty)
+        with self._lock:
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+        self._executor().submit(self._refill, *key)
+
+    def schedule_unit(self, subject_id: int, unit_id: int):
+        for difficulty in DIFFICULTIES:
+            self.schedule(subject_id, unit_id, difficulty)
+
+    def resume(self):
+        """Schedule every unit with processed documents (tops up partial banks after a restart)."""
+        db = SessionLocal()
+        try:
+            units = db.query(Unit.subject_id, Unit.id).join(
+                Document, Document.unit_id == Unit.id
+            ).filter(Document.is_processed.is_(True)).distinct().all()
+        finally:
+            db.close()
+
+        for subject_id, unit_id in units:
+            self.schedule_unit(subject_id, unit_id)
+        if units:
+            print(f"🏦 Question bank refill scheduled for {len(units)} units")
+
+    def purge_unit(self, unit_id: int) -> int:
+        """Drop a unit's banked questions (its study material changed)."""
+        db = SessionLocal()
+        try:
+            removed = db.query(QuestionBank).filter(
+                QuestionBank.unit_id == unit_id
+            ).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def depth(self, unit_id: int, difficulty: str) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(QuestionBank).filter(
+                QuestionBank.unit_id == unit_id,
+                QuestionBank.difficulty == difficulty
+            ).count()
+        finally:
+            db.close()
+
+    def _lease(self, unit_id: int, difficulty: str) -> bool:
+        """Take or renew this worker's lease on a bank; False while another worker holds it."""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=QUESTION_BANK_LEASE_SECONDS)
+        db = SessionLocal()
+        try:
+            lease = db.query(QuestionBankLease).filter(
+                QuestionBankLease.unit_id == unit_id,
+                QuestionBankLease.difficulty == difficulty
+            )
+            # Conditional, so two workers never both take an expired lease
+            taken = lease.filter(
+                or_(QuestionBankLease.holder == self.holder, QuestionBankLease.expires_at < now)
+            ).update({"holder": self.holder, "expires_at": expires_at}, synchronize_session=False)
+            if not taken:
+                if lease.first():
+                    return False
+                db.add(QuestionBankLease(
+                    unit_id=unit_id, difficulty=difficulty, holder=self.holder, expires_at=expires_at
+                ))
+            db.commit()
+            return True
+        except IntegrityError:
+            # Another worker created the lease first
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def _release(self, unit_id: int, difficulty: str):
+        db = SessionLocal()
+        try:
+            db.query(QuestionBankLease).filter(
+                QuestionBankLease.unit_id == unit_id,
+                QuestionBankLease.difficulty == difficulty,
+                QuestionBankLease.holder == self.holder
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _refill(self, subject_id: int, unit_id: int, difficulty: str):
+        # ai_service serves from the bank; imported here to avoid the cycle
+        from backend.services.ai_service import generate_questions
+
+        with self._lock:
+            self._scheduled.discard((subject_id, unit_id, difficulty))
+
+        if self.depth(unit_id, difficulty) >= QUESTION_BANK_DEPTH:
+            return
+        if not self._lease(unit_id, difficulty):
+            with self._lock:
+                self.leased_elsewhere += 1
+            return
+
+        t0 = time.perf_counter()
+        added = 0
+        try:
+            missing = QUESTION_BANK_DEPTH - self.depth(unit_id, difficulty)
+            while missing > 0:
+                questions = generate_questions(
+                    subject_id, unit_id, min(QUESTION_BANK_BATCH, missing), difficulty, background=True
+                )
+                stored = self._store(subject_id, unit_id, difficulty, questions or [])
+                if not stored or not self._lease(unit_id, difficulty):
+                    break
+                added += stored
+                missing = QUESTION_BANK_DEPTH - self.depth(unit_id, difficulty)
+        except Exception as e:
+            print(f"⚠️ Question bank refill failed for unit {unit_id} ({difficulty}):", e)
+        finally:
+            self._release(unit_id, difficulty)
+
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self.refills += 1
+            self.added += added
+            self.refill_seconds += elapsed
+            if added:
+                self.last_refill = datetime.utcnow()
+        if added:
+            print(f"🏦 Question bank unit {unit_id} ({difficulty}): +{added} questions in {elapsed:.1f}s")
+
+    def _store(self, subject_id: int, unit_id: int, difficulty: str, questions: List[Dict]) -> int:
+        """Insert new questions, up to the bank's remaining room as of this transaction."""
+        db = SessionLocal()
+        try:
+            known = {
+                key for (key,) in db.query(QuestionBank.question_key).filter(
+                    QuestionBank.unit_id == unit_id,
+                    QuestionBank.difficulty == difficulty
+                )
+            }
+            room = QUESTION_BANK_DEPTH - len(known)
+            stored = 0
+            for question in questions:
+                if stored >= room:
+                    break
+                key = question_key(question["question"])
+                if key in known:
+                    continue
+                known.add(key)
+                db.add(QuestionBank(
+                    subject_id=subject_id,
+                    unit_id=unit_id,
+                    difficulty=difficulty,
+                    question_key=key,
+                    question_data=json.dumps(question)
+                ))
+                stored += 1
+            db.commit()
+            return stored
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # ---------- METRICS ----------
+
+    def stats(self) -> Dict:
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                QuestionBank.unit_id, QuestionBank.difficulty, func.count(QuestionBank.id)
+            ).group_by(QuestionBank.unit_id, QuestionBank.difficulty).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            minutes = max(1e-9, (time.time() - self.started) / 60)
+            return {
+                "target_depth": QUESTION_BANK_DEPTH,
+                "banks": [
+                    {"unit_id": unit_id, "difficulty": difficulty, "depth": depth}
+                    for unit_id, difficulty, depth in sorted(rows)
+                ],
+                "total_questions": sum(depth for _, _, depth in rows),
+                "served": self.served,
+                "short_takes": self.short,
+                "refills": self.refills,
+                "refills_leased_elsewhere": self.leased_elsewhere,
+                "refills_pending": len(self._scheduled),
+                "questions_added": self.added,
+                "added_per_minute": round(self.added / minutes, 2),
+                "refill_seconds_avg": round(self.refill_seconds / self.refills, 2) if self.refills else None,
+                "last_refill": self.last_refill.isoformat() if self.last_refill else None
+            }
+
+
+question_bank = QuestionBankService()
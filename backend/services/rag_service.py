@@ -1,206 +1,704 @@
 """
 RAG (Retrieval Augmented Generation) Service
-Handles PDF ingestion, text chunking, embeddings, vector storage (FAISS), and retrieval
+Handles PDF ingestion, text chunking, embeddings, vector storage (FAISS), BM25 keyword search and retrieval
 """
 
 import os
 import pickle
 import random
-from typing import List, Dict
+import threading
+import time
+from typing import Callable, List, Dict, Optional, Tuple
 
 import numpy as np
 import faiss
-from PyPDF2 import PdfReader
+
+from backend.services.embedding_backends import (
+    EMBEDDING_BACKEND, EmbeddingBackend, get_embedding_backend, resolve_backend_name
+)
+from backend.services.embedding_cache import EmbeddingCache
+from backend.services.index_factory import (
+    RERANK_FACTOR, exact_rerank, index_spec, search_parameters
+)
+from backend.services.lexical_index import bm25_search
+from backend.services.segment_store import Segment, SegmentStore, tier_full
+from backend.services.shard_cache import ShardCache
+from backend.services.text_pipeline import StreamingChunker, chunk_text, iter_pdf_pages
+from backend.services.unit_digest import merge_digests, ordered
 
 # ---------------- CONFIG ----------------
 
 UPLOAD_DIR = "uploads"
 VECTOR_DB_DIR = "vector_db"
 
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
 EMBEDDING_DIM = 1536
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+# Chunks embedded and committed per segment while a PDF is still being parsed
+INGEST_BATCH_CHUNKS = int(os.getenv("RAG_INGEST_BATCH_CHUNKS", 128))
 
-# ---------------- OPENAI CLIENT ----------------
+# Merge a subject's segments of similar size in the background once this
+# many have accumulated (segment_store sets the size tiers)
+COMPACT_MIN_SEGMENTS = int(os.getenv("RAG_COMPACT_MIN_SEGMENTS", 8))
 
-_openai_client = None
+# Memory-map segments so gunicorn workers share one page-cached copy
+SHARED_INDEX = os.getenv("RAG_SHARED_INDEX", "").lower() in ("1", "true", "yes")
 
-def get_openai_client():
-    global _openai_client
-    if _openai_client is None:
-        from openai import OpenAI
-        _openai_client = OpenAI()
-    return _openai_client
+# How queries rank chunks: dense (embeddings), lexical (BM25) or hybrid (both)
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").strip().lower()
+# Hybrid fetches this many candidates per result from each ranking
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", 4))
+# Reciprocal rank fusion constant
+RRF_K = 60
 
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(VECTOR_DB_DIR, exist_ok=True)
 
-# ---------------- RAG SERVICE ----------------
 
-class RAGService:
-    def __init__(self):
-        self.index_path = os.path.join(VECTOR_DB_DIR, "faiss_index.bin")
-        self.metadata_path = os.path.join(VECTOR_DB_DIR, "metadata.pkl")
+def _entries_by_subject(entries: List[Dict]) -> Dict[Optional[int], List[Dict]]:
+    by_subject: Dict[Optional[int], List[Dict]] = {}
+    for entry in entries:
+        by_subject.setdefault(entry.get("subject_id"), []).append(entry)
+    return by_subject
 
-        self.index = None
-        self.metadata: List[Dict] = []
+# ---------------- RAG SERVICE ----------------
 
+class RAGService:
+    """
+    Thread-safe for one ingesting / many retrieving threads per worker.
+
+    Readers take no lock: everything they read (the entry map, each loaded
+    shard's segment list, every Segment, the embedding backend with its
+    cache) is an immutable snapshot that writers replace with a single
+    assignment. Writers (appends, tombstones, compaction, cross-worker
+    refresh, cold shard loads) serialise on _segments_lock and publish the
+    new state only once it is complete, so a retrieval sees either the old
+    snapshot or the new one, never a mix.
+    """
+
+    def __init__(self, vector_db_dir: str = VECTOR_DB_DIR, shared: bool = SHARED_INDEX):
+        # Pre-segment single-file format, migrated on first load
+        self.index_path = os.path.join(vector_db_dir, "faiss_index.bin")
+        self.metadata_path = os.path.join(vector_db_dir, "metadata.pkl")
+
+        self.store = SegmentStore(vector_db_dir, EMBEDDING_DIM)
+        self.shared = shared
+        self._compaction_lock = threading.Lock()
+        self._segments_lock = threading.Lock()
+
+        # subject_id -> manifest entries of its segments (None: mixed
+        # segments from before sharding, searched for every subject).
+        # Replaced, never mutated in place, so readers can hold a reference
+        self.entries: Dict[Optional[int], List[Dict]] = {}
+        # Segments are opened per subject on first use and kept in an LRU
+        self.shards = ShardCache()
+        # Deleted document ids; their chunks stay on disk until compaction
+        self.tombstones = frozenset()
+        # (subject_id, unit_id) -> merged digest and the segments / tombstones it reflects
+        self._digests: Dict[Tuple[int, int], Dict] = {}
+        self._digests_lock = threading.Lock()
+
+        # Manifest generation this worker has applied, and the manifest
+        # mtime it was read at, so staleness checks are a single stat()
+        self.generation = 0
+        self._manifest_mtime = None
+
+        self.vector_db_dir = vector_db_dir
         self._load_or_create_index()
+        self._set_embedding_backend(self._select_embedding_backend())
 
     # ---------- FAISS SETUP ----------
 
     def _load_or_create_index(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
-            try:
-                self.index = faiss.read_index(self.index_path)
-                with open(self.metadata_path, "rb") as f:
-                    self.metadata = pickle.load(f)
-                print("✅ FAISS index loaded")
+        self.entries = {}
+        try:
+            if not self.store.exists() and os.path.exists(self.index_path) \
+                    and os.path.exists(self.metadata_path):
+                with self.store._locked():
+                    # Another worker may have migrated it while we waited
+                    if not self.store.exists():
+                        self._migrate_legacy_index()
+
+            if any(e.get("subject_id") is None for e in self.store.read_manifest()["segments"]):
+                print("🔀 Splitting the index into per-subject shards")
+                self.store.compact(force=True)
+
+            self._manifest_mtime = self._stat_manifest()
+            manifest = self.store.read_manifest()
+            self.tombstones = frozenset(manifest.get("tombstones", []))
+            self.entries = _entries_by_subject(manifest["segments"])
+            self.generation = manifest.get("generation", 0)
+
+            recorded = self.store.index_spec(manifest)
+            if recorded != index_spec():
+                print(f"⚠️ Index settings are {recorded}; configured {index_spec()} take effect after a rebuild")
+
+            if manifest["segments"]:
+                mode = "shared mmap" if self.shared else "private"
+                print(
+                    f"✅ FAISS index opened ({len(manifest['segments'])} segments in "
+                    f"{len(self.entries)} subject shards, loaded on first use, "
+                    f"{recorded['index_type']}/{recorded['vector_storage']}, {mode})"
+                )
                 return
-            except Exception as e:
-                print("⚠️ Failed to load FAISS index:", e)
+        except Exception as e:
+            print("⚠️ Failed to load FAISS index:", e)
 
         self._create_new_index()
 
     def _create_new_index(self):
-        self.index = faiss.IndexFlatL2(EMBEDDING_DIM)
-        self.metadata = []
+        self.entries = {}
         print("🆕 New FAISS index created")
 
-    def _save_index(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+    def _migrate_legacy_index(self):
+        """
+        Rewrite faiss_index.bin + metadata.pkl as one segment per subject,
+        committed with one manifest write. Runs under the store lock.
+        """
+        index = faiss.read_index(self.index_path)
+        with open(self.metadata_path, "rb") as f:
+            metadata = pickle.load(f)
+
+        # Legacy vectors are positional; text-only chunks could reuse their ids
+        next_chunk_id = max([m["chunk_id"] for m in metadata] + [index.ntotal - 1]) + 1
+        seen = set()
+        by_subject: Dict[int, Tuple[List[Dict], List[np.ndarray]]] = {}
+        for m in metadata:
+            record = dict(m)
+            if record["chunk_id"] in seen:
+                record["chunk_id"] = next_chunk_id
+                next_chunk_id += 1
+            seen.add(record["chunk_id"])
+
+            records, vectors = by_subject.setdefault(record["subject_id"], ([], []))
+            record["has_vector"] = record["chunk_id"] < index.ntotal
+            if record["has_vector"]:
+                vectors.append(index.reconstruct(record["chunk_id"]))
+            records.append(record)
+
+        manifest = self.store.read_manifest()
+        for subject_id in sorted(by_subject):
+            records, vectors = by_subject[subject_id]
+            self.store._append_locked(
+                manifest,
+                records,
+                np.array(vectors, dtype="float32") if vectors else None
+            )
+        self.store._write_manifest(manifest)
+        print(f"🔁 Legacy FAISS index migrated ({len(metadata)} chunks, {len(by_subject)} subjects)")
+
+    def _open_segment(self, entry: Dict) -> Segment:
+        return self.store.open_segment(entry, self.shared, self.tombstones)
+
+    def _select_embedding_backend(self) -> EmbeddingBackend:
+        """Queries must be embedded like the index was; the manifest remembers how."""
+        configured = resolve_backend_name(EMBEDDING_BACKEND)
+        recorded = self.store.read_manifest().get("embedding_backend")
+        if recorded and recorded != configured:
+            print(
+                f"⚠️ Index was built with {recorded}; EMBEDDING_BACKEND={EMBEDDING_BACKEND} "
+                "takes effect after a rebuild"
+            )
+        backend = get_embedding_backend(recorded or configured, EMBEDDING_DIM)
+        print(f"🧠 Embedding backend: {backend.name}")
+        return backend
+
+    def _set_embedding_backend(self, backend: EmbeddingBackend):
+        cache = EmbeddingCache(
+            os.path.join(self.vector_db_dir, "embedding_cache.sqlite"),
+            backend.name
+        )
+        # One assignment, so no thread pairs one backend with another's cache
+        self._embedder = (backend, cache)
+
+    @property
+    def embedding_backend(self) -> EmbeddingBackend:
+        return self._embedder[0]
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        return self._embedder[1]
+
+    @property
+    def segments(self) -> List[Segment]:
+        """Segments of the shards currently loaded in this worker."""
+        loaded = {}
+        for _, segments in self.shards.items():
+            loaded.update((s.id, s) for s in segments)
+        return list(loaded.values())
+
+    @property
+    def chunk_count(self) -> int:
+        return sum(e["count"] for entries in self.entries.values() for e in entries)
+
+    # ---------- SHARDS ----------
+
+    def _shard_entries(self, subject_id: int) -> List[Dict]:
+        return self.entries.get(subject_id, []) + self.entries.get(None, [])
+
+    def shard_segments(self, subject_id: int) -> List[Segment]:
+        """
+        The loaded segments of one subject, opening them on a cache miss.
+
+        Loading happens under the segments lock, so a shard always matches
+        the manifest entries it was opened from; warm lookups take only the
+        cache's own lock.
+        """
+        segments = self.shards.get(subject_id)
+        if segments is not None:
+            return segments
+
+        with self._segments_lock:
+            segments = self.shards.peek(subject_id)
+            if segments is not None:
+                return segments
+
+            t0 = time.perf_counter()
+            segments, _ = self._sync_segments([], self._shard_entries(subject_id))
+            elapsed = time.perf_counter() - t0
+            self.shards.put(subject_id, segments, load_seconds=elapsed)
+
+        print(f"📦 Shard for subject {subject_id} loaded ({len(segments)} segments, {elapsed * 1000:.1f} ms)")
+        return segments
+
+    def shard_stats(self) -> Dict:
+        stats = self.shards.stats()
+        stats["subjects"] = len([s for s in self.entries if s is not None])
+        stats["generation"] = self.generation
+        return stats
+
+    def _sync_segments(
+        self,
+        segments: List[Segment],
+        entries: List[Dict]
+    ) -> Tuple[List[Segment], int]:
+        """
+        Segments for `entries`, reusing those already in `segments`; returns
+        them with the number of segments that had to be opened.
+        """
+        loaded = {s.id: s for s in segments}
+        covered = set()
+        for s in segments:
+            covered.update(s.entry["sources"])
+
+        synced = []
+        opened = 0
+        for entry in entries:
+            sources = set(entry["sources"])
+            if entry["id"] in loaded:
+                synced.append(loaded[entry["id"]])
+            elif sources <= covered:
+                # Compacted elsewhere from segments we already hold: keep ours
+                synced.extend(
+                    s for s in segments if set(s.entry["sources"]) <= sources
+                )
+            else:
+                synced.append(self._open_segment(entry))
+                opened += 1
+        return synced, opened
 
-    # ---------- PDF TEXT EXTRACTION ----------
+    # ---------- CROSS-WORKER REFRESH ----------
 
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        text = ""
+    def _stat_manifest(self):
         try:
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+            return os.stat(self.store.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh_if_stale(self):
+        """
+        Pick up segments committed by other workers since our last look.
+
+        The fast path is one stat() of the manifest. When it changed and the
+        generation moved, loaded shards open only the segments this worker
+        does not hold yet; each shard is swapped in one assignment, so
+        retrievals in flight keep using the previous one. Shards that are
+        not loaded only get their entry lists updated.
+        """
+        mtime = self._stat_manifest()
+        if mtime is None or mtime == self._manifest_mtime:
+            return
+
+        with self._segments_lock:
+            if mtime == self._manifest_mtime:
+                return
+            manifest = self.store.read_manifest()
+            self._manifest_mtime = mtime
+            if manifest.get("generation", 0) == self.generation:
+                return
+            self._apply_manifest(manifest)
+
+    def _apply_manifest(self, manifest: Dict, reopen: bool = False):
+        """
+        Bring loaded shards in line with `manifest`. With `reopen`, segments
+        no longer listed are dropped rather than kept in place of what they
+        were compacted into (this worker's own compactions, to free them).
+        """
+        recorded = manifest.get("embedding_backend")
+        if recorded and recorded != self.embedding_backend.name:
+            # A rebuild switched the index to another backend
+            print(f"🧠 Embedding backend: {recorded}")
+            self._set_embedding_backend(get_embedding_backend(recorded, EMBEDDING_DIM))
+
+        tombstones = frozenset(manifest.get("tombstones", []))
+        self.tombstones = tombstones
+        self.entries = _entries_by_subject(manifest["segments"])
+        listed = {e["id"] for e in manifest["segments"]}
+
+        opened = 0
+        for subject_id, segments in self.shards.items():
+            entries = self._shard_entries(subject_id)
+            if not entries:
+                self.shards.discard(subject_id)
+                continue
+            if reopen:
+                segments = [s for s in segments if s.id in listed]
+            segments, n = self._sync_segments(segments, entries)
+            self.shards.put(subject_id, [
+                s if s.tombstones == tombstones else s.with_tombstones(tombstones)
+                for s in segments
+            ])
+            opened += n
+
+        print(
+            f"🔄 Index generation {self.generation} -> {manifest.get('generation', 0)} "
+            f"({opened} new segments)"
+        )
+        self.generation = manifest.get("generation", 0)
+
+    # ---------- PERSISTENCE ----------
+
+    def _persist_chunks(
+        self,
+        chunks: List[str],
+        embeddings: np.ndarray,
+        has_vector: np.ndarray,
+        subject_id: int,
+        unit_id: int,
+        document_id: int
+    ):
+        """Append one segment to disk, then publish it to readers."""
+        records = [
+            {
+                "subject_id": subject_id,
+                "unit_id": unit_id,
+                "document_id": document_id,
+                "text": chunk,
+                "has_vector": bool(flag)
+            }
+            for chunk, flag in zip(chunks, has_vector)
+        ]
 
-            print(f"📄 Extracted text length: {len(text)}")
-            return text
+        entry, _ = self.store.append_segment(
+            records,
+            embeddings[has_vector],
+            settings={"embedding_backend": self.embedding_backend.name}
+        )
+        # Only shards this worker has loaded need the segment opened now
+        subject_id = entry["subject_id"]
+        segment = self._open_segment(entry) if self.shards.peek(subject_id) is not None else None
+        with self._segments_lock:
+            known = self.entries.get(subject_id, [])
+            if any(e["id"] == entry["id"] for e in known):
+                # A refresh already picked the segment up
+                return self._maybe_compact()
+
+            entries = dict(self.entries)
+            entries[subject_id] = known + [entry]
+            self.entries = entries
+            loaded = self.shards.peek(subject_id)
+            if loaded is not None:
+                segment = segment or self._open_segment(entry)
+                if segment.tombstones != self.tombstones:
+                    # A document was deleted while the segment was being opened
+                    segment = segment.with_tombstones(self.tombstones)
+                self.shards.put(subject_id, loaded + [segment])
+        self._maybe_compact()
+
+    def _maybe_compact(self, deleted: bool = False):
+        """
+        Start a background size-tiered compaction when a subject has a full
+        size tier, or after a deletion (which may leave a segment mostly dead).
+        """
+        segments = self.store.read_manifest()["segments"]
+        per_subject = _entries_by_subject(segments)
+        if not deleted and not any(
+            tier_full(entries, COMPACT_MIN_SEGMENTS) for entries in per_subject.values()
+        ):
+            return
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                if self.store.compact(min_segments=COMPACT_MIN_SEGMENTS):
+                    self._apply_compaction()
+            except Exception as e:
+                print("⚠️ Compaction failed:", e)
+            finally:
+                self._compaction_lock.release()
+
+        threading.Thread(target=run, name="rag-compaction", daemon=True).start()
+
+    def _apply_compaction(self):
+        """Swap the segments a compaction merged for the merged ones."""
+        with self._segments_lock:
+            self._manifest_mtime = self._stat_manifest()
+            self._apply_manifest(self.store.read_manifest(), reopen=True)
+
+    # ---------- DELETION ----------
+
+    def delete_document(self, document_id: int) -> int:
+        """
+        Tombstone a document's chunks. Retrieval in every worker stops
+        returning them at once; compact_index() removes them from disk.
+        """
+        manifest = self.store.add_tombstones([document_id])
+        with self._segments_lock:
+            self._apply_manifest(manifest)
+
+        hidden = self.store.count_chunks(document_id)
+        print(f"🪦 Document {document_id} tombstoned ({hidden} chunks hidden)")
+        self._maybe_compact(deleted=True)
+        return hidden
+
+    def _reclaim_document_id(self, document_id: int):
+        """
+        Databases that reuse ids (SQLite without AUTOINCREMENT) can hand a
+        new upload a deleted document's id. Drop the old chunks from disk,
+        then lift the tombstone, so the new chunks are not hidden.
+        """
+        if document_id not in self.store.read_manifest().get("tombstones", []):
+            return
+        with self._compaction_lock:
+            self.store.compact(force=True)
+            if not self.store.release_tombstone(document_id):
+                raise RuntimeError(f"Document id {document_id} still has deleted chunks on disk")
+            self._apply_compaction()
+        print(f"♻️ Document id {document_id} reused; its deleted chunks were purged")
+
+    def compact_index(self) -> Dict:
+        """
+        Rewrite each subject's segments as one without tombstoned chunks,
+        and report what that reclaimed on disk and in this worker's loaded
+        shards.
+        """
+        self.refresh_if_stale()
+        entries_before = self.store.read_manifest()["segments"]
+        memory_before = sum(s.nbytes for s in self.segments)
+
+        with self._compaction_lock:
+            self.store.compact(force=True)
+            entries_after = self.store.read_manifest()["segments"]
+            if entries_after != entries_before:
+                self._apply_compaction()
+
+        memory_after = sum(s.nbytes for s in self.segments)
+        chunks_before = sum(e["count"] for e in entries_before)
+        chunks_after = sum(e["count"] for e in entries_after)
+        disk_before = sum(e["bytes"] for e in entries_before)
+        disk_after = sum(e["bytes"] for e in entries_after)
+
+        return {
+            "compacted": entries_after != entries_before,
+            "segments_before": len(entries_before),
+            "segments_after": len(entries_after),
+            "chunks_before": chunks_before,
+            "chunks_after": chunks_after,
+            "dead_chunks_removed": chunks_before - chunks_after,
+            "memory_bytes_before": memory_before,
+            "memory_bytes_after": memory_after,
+            "memory_bytes_reclaimed": memory_before - memory_after,
+            "disk_bytes_before": disk_before,
+            "disk_bytes_after": disk_after,
+            "disk_bytes_reclaimed": disk_before - disk_after
+        }
 
-        except Exception as e:
-            print("❌ PDF extraction error:", e)
-            return ""
+    # ---------- PDF TEXT EXTRACTION ----------
+
+    def extract_text_from_pdf(self, file_path: str) -> str:
+        text = "".join(iter_pdf_pages(file_path))
+        print(f"📄 Extracted text length: {len(text)}")
+        return text
 
     # ---------- CHUNKING ----------
 
     def chunk_text(self, text: str) -> List[str]:
-        chunks = []
-        text = text.strip()
-
-        if not text:
-            return chunks
-
-        start = 0
-        text_len = len(text)
-
-        while start < text_len:
-            end = start + CHUNK_SIZE
+        return chunk_text(text)
 
-            if end < text_len:
-                split_point = max(
-                    text.rfind(".", start, end),
-                    text.rfind("\n", start, end)
-                )
-                if split_point > start:
-                    end = split_point + 1
-
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
+    # ---------- EMBEDDINGS ----------
 
-            start = end - CHUNK_OVERLAP
-            if start < 0 or start >= text_len:
-                break
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        vectors, ok = self.embed_texts(texts)
+        if not ok.all():
+            return np.array([])
+        return vectors
 
-        return chunks
+    def embed_texts(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Embed `texts` with the index's backend, through the cache when the
+        backend is remote. Returns (vectors, ok); rows that could not be
+        embedded are flagged False.
+        """
+        backend, cache = self._embedder
+        if not backend.cacheable:
+            return backend.embed(texts, progress)
+
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype="float32")
+        ok = np.zeros(len(texts), dtype=bool)
+
+        for i, vector in enumerate(cache.get_many(texts)):
+            if vector is not None:
+                vectors[i] = vector
+                ok[i] = True
+
+        missing = np.flatnonzero(~ok)
+        if len(missing):
+            print(f"🧮 Embedding {len(missing)} of {len(texts)} texts ({len(texts) - len(missing)} cached)")
+            fetched, fetched_ok = backend.embed([texts[i] for i in missing], progress)
+            vectors[missing[fetched_ok]] = fetched[fetched_ok]
+            ok[missing[fetched_ok]] = True
+
+            cache.put_many(
+                [texts[i] for i in missing[fetched_ok]], fetched[fetched_ok]
+            )
+
+        return vectors, ok
 
-    # ---------- EMBEDDINGS ----------
+    # ---------- INGEST DOCUMENT ----------
 
-    def get_embeddings(self, texts: List[str]) -> np.ndarray:
-        try:
-            client = get_openai_client()
-            vectors = []
-
-            for i in range(0, len(texts), 20):
-                batch = texts[i:i + 20]
-                response = client.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=batch
-                )
-                for item in response.data:
-                    vectors.append(item.embedding)
+    def _ingest_batch(
+        self,
+        chunks: List[str],
+        subject_id: int,
+        unit_id: int,
+        document_id: int,
+        on_embedded: Optional[Callable[[int], None]] = None
+    ):
+        def progress(done, total):
+            print(f"🧮 Embedding progress {done}/{total} chunks")
+            if on_embedded:
+                on_embedded(done)
 
-            return np.array(vectors, dtype="float32")
+        embeddings, ok = self.embed_texts(chunks, progress=progress)
 
-        except Exception as e:
-            print("⚠️ Embedding error:", e)
-            return np.array([])
+        # --- If embeddings FAIL, still save chunks ---
+        if not ok.all():
+            print(f"⚠️ {int((~ok).sum())} of {len(chunks)} embeddings failed – saving those text only")
 
-    # ---------- INGEST DOCUMENT ----------
+        self._persist_chunks(chunks, embeddings, ok, subject_id, unit_id, document_id)
 
     def ingest_document(
         self,
         file_path: str,
         subject_id: int,
         unit_id: int,
-        document_id: int
+        document_id: int,
+        progress: Optional[Callable[[str, int, int, int], None]] = None
     ) -> int:
-
-        text = self.extract_text_from_pdf(file_path)
-        if not text.strip():
+        """
+        Stream the PDF page by page: pages feed the chunker, and every
+        INGEST_BATCH_CHUNKS chunks are embedded and committed as a segment,
+        so earlier pages are searchable while later ones are still parsed.
+
+        `progress(stage, pages_parsed, chunks_created, chunks_embedded)` is
+        called as pages are parsed and batches are embedded.
+        """
+        self._reclaim_document_id(document_id)
+
+        chunker = StreamingChunker()
+        pending: List[str] = []
+        total = 0
+        pages = 0
+        text_length = 0
+
+        def report(stage, embedded=0):
+            if progress:
+                progress(stage, pages, total + len(pending), total + embedded)
+
+        def flush():
+            nonlocal pending, total
+            report("embedding")
+            self._ingest_batch(
+                pending, subject_id, unit_id, document_id,
+                on_embedded=lambda done: report("embedding", done)
+            )
+            total += len(pending)
+            pending = []
+            report("parsing")
+
+        for page_text in iter_pdf_pages(file_path):
+            pages += 1
+            text_length += len(page_text)
+            pending.extend(chunker.feed(page_text))
+            report("parsing")
+            if len(pending) >= INGEST_BATCH_CHUNKS:
+                flush()
+
+        pending.extend(chunker.finish())
+        print(f"📄 Extracted text length: {text_length}")
+
+        if pending:
+            flush()
+
+        if not total:
             print("❌ No text extracted from PDF")
             return 0
 
-        chunks = self.chunk_text(text)
-        print(f"🧩 Chunks created: {len(chunks)}")
-
-        if not chunks:
-            return 0
-
-        embeddings = self.get_embeddings(chunks)
-
-        start_idx = self.index.ntotal
-
-        # --- If embeddings FAIL, still save chunks ---
-        if embeddings is None or len(embeddings) == 0:
-            print("⚠️ Embeddings failed – saving text only")
-
-            for i, chunk in enumerate(chunks):
-                self.metadata.append({
-                    "chunk_id": start_idx + i,
-                    "subject_id": subject_id,
-                    "unit_id": unit_id,
-                    "document_id": document_id,
-                    "text": chunk
-                })
-
-            self._save_index()
-            return len(chunks)
-
-        # --- Normal path ---
-        self.index.add(embeddings)
-
-        for i, chunk in enumerate(chunks):
-            self.metadata.append({
-                "chunk_id": start_idx + i,
-                "subject_id": subject_id,
-                "unit_id": unit_id,
-                "document_id": document_id,
-                "text": chunk
-            })
-
-        self._save_index()
-        return len(chunks)
+        print(f"🧩 Chunks created: {total}")
+        return total
+
+    # ---------- DIGESTS ----------
+
+    def unit_digest(self, subject_id: int, unit_id: int) -> List[Dict]:
+        """
+        The unit's digest sentences (see unit_digest), concepts first.
+
+        Merged from the precomputed digests of the segments holding the
+        unit and cached. When segments were only appended since, just their
+        sentences are merged in; a new tombstone or a compaction rebuilds
+        the merge (still from stored digests, not chunk text).
+        """
+        self.refresh_if_stale()
+        key = (int(subject_id), int(unit_id))
+        segments = [s for s in self.shard_segments(key[0]) if key in s.units]
+        segment_ids = [s.id for s in segments]
+        tombstones = self.tombstones
+
+        with self._digests_lock:
+            cached = self._digests.get(key)
+        if cached and cached["segment_ids"] == segment_ids and cached["tombstones"] == tombstones:
+            return cached["items"]
+
+        def unit_items(segment):
+            return [
+                item for item in segment.digest_items()
+                if item["unit_id"] == key[1] and item["document_id"] not in tombstones
+            ]
+
+        known = set(cached["segment_ids"]) if cached else set()
+        if cached and cached["tombstones"] == tombstones and known <= set(segment_ids):
+            seen = set(cached["keys"])
+            added = merge_digests(
+                (unit_items(s) for s in segments if s.id not in known), seen
+            )
+            items = ordered(cached["items"] + added)
+        else:
+            seen = set()
+            items = ordered(merge_digests((unit_items(s) for s in segments), seen))
+
+        with self._digests_lock:
+            self._digests[key] = {
+                "segment_ids": segment_ids,
+                "tombstones": tombstones,
+                "keys": seen,
+                "items": items
+            }
+        return items
 
     # ---------- RETRIEVAL ----------
 
@@ -209,38 +707,141 @@ class RAGService:
         subject_id: int,
         unit_id: int,
         query: str = "",
-        top_k: int = 5
+        top_k: int = 5,
+        mode: Optional[str] = None
     ) -> List[Dict]:
-
-        filtered = [
-            m for m in self.metadata
-            if m["subject_id"] == subject_id and m["unit_id"] == unit_id
-        ]
-
-        if not filtered:
+        """
+        Up to `top_k` chunks of one unit. With a `query` they are ranked by
+        `mode` (RAG_RETRIEVAL_MODE by default): "dense" embeds the query,
+        "lexical" uses BM25 only (no network), "hybrid" fuses both. Without a
+        query, or when nothing matches, a random sample is returned.
+        """
+        if mode and mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode} (expected one of {', '.join(RETRIEVAL_MODES)})")
+
+        self.refresh_if_stale()
+
+        key = (int(subject_id), int(unit_id))
+        units = [(s, s.units.get(key)) for s in self.shard_segments(key[0])]
+        units = [(s, positions) for s, positions in units if positions is not None]
+        if not units:
             return []
+        segments = [s for s, _ in units]
 
-        if query and self.index.ntotal > 0:
-            q_emb = self.get_embeddings([query])
-            if len(q_emb) > 0:
-                k = min(top_k * 3, self.index.ntotal)
-                _, indices = self.index.search(q_emb, k)
-
-                results = []
-                valid_ids = {m["chunk_id"] for m in filtered}
+        if query:
+            results = self._query_unit(query, key, units, top_k, mode or RETRIEVAL_MODE)
+            if results:
+                return results
 
-                for idx in indices[0]:
-                    if idx in valid_ids:
-                        for m in filtered:
-                            if m["chunk_id"] == idx:
-                                results.append(m)
-                                break
-                    if len(results) >= top_k:
-                        break
+        sizes = np.cumsum([len(positions) for _, positions in units])
+        picks = random.sample(range(int(sizes[-1])), min(top_k, int(sizes[-1])))
 
-                return results[:top_k]
+        results = []
+        for pick in picks:
+            seg_i = int(np.searchsorted(sizes, pick, side="right"))
+            offset = pick - (int(sizes[seg_i - 1]) if seg_i else 0)
+            segment, positions = units[seg_i]
+            results.append(segment.record(int(positions[offset])))
+        return results
 
-        return random.sample(filtered, min(top_k, len(filtered)))
+    def _query_unit(
+        self,
+        query: str,
+        key: Tuple[int, int],
+        units: List[Tuple[Segment, np.ndarray]],
+        top_k: int,
+        mode: str
+    ) -> List[Dict]:
+        """
+        Rank a unit's chunks for `query`. Dense retrieval falls back to
+        lexical when the query cannot be embedded; hybrid fetches
+        HYBRID_CANDIDATES times more from each side and fuses them with
+        reciprocal rank fusion (scores of the two are not comparable).
+        """
+        segments = [s for s, _ in units]
+        fetch = top_k * HYBRID_CANDIDATES if mode == "hybrid" else top_k
+
+        dense = []
+        if mode != "lexical" and any(s.index is not None for s in segments):
+            q_emb = self.get_embeddings([query])
+            if len(q_emb) > 0:
+                dense = self._search_unit(q_emb, key, segments, fetch)
+
+        if mode == "dense" and dense:
+            return dense
+
+        lexical = self._lexical_unit(query, units, fetch)
+        if mode != "hybrid" or not dense:
+            return lexical[:top_k]
+        if not lexical:
+            return dense[:top_k]
+
+        fused: Dict[int, float] = {}
+        records: Dict[int, Dict] = {}
+        for ranked in (dense, lexical):
+            for rank, record in enumerate(ranked):
+                fused[record["chunk_id"]] = fused.get(record["chunk_id"], 0.0) + 1.0 / (RRF_K + rank + 1)
+                records[record["chunk_id"]] = record
+        best = sorted(fused, key=lambda chunk_id: -fused[chunk_id])[:top_k]
+        return [records[chunk_id] for chunk_id in best]
+
+    def _lexical_unit(
+        self,
+        query: str,
+        units: List[Tuple[Segment, np.ndarray]],
+        top_k: int
+    ) -> List[Dict]:
+        """BM25 over one unit's chunks; IDF is computed over the segments holding it."""
+        hits = bm25_search(
+            query,
+            [(segment.lexical_index(), positions, segment) for segment, positions in units],
+            top_k
+        )
+        return [segment.record(pos) for _, segment, pos in hits]
+
+    def _search_unit(
+        self,
+        q_emb: np.ndarray,
+        key: Tuple[int, int],
+        segments: List[Segment],
+        top_k: int
+    ) -> List[Dict]:
+        """
+        Nearest neighbours restricted to one unit's chunk ids. Lossy
+        (quantised or projected) segments return RERANK_FACTOR times more
+        candidates, which are re-ranked on their exact float32 vectors.
+        """
+        hits = []
+        for segment in segments:
+            positions = segment.units.get(key)
+            if segment.index is None or positions is None:
+                continue
+
+            unit_ids = np.ascontiguousarray(
+                segment.meta["chunk_id"][positions], dtype="int64"
+            )
+            rerank = segment.vectors is not None
+            k = min(top_k * RERANK_FACTOR if rerank else top_k, len(unit_ids))
+            params = search_parameters(segment.index, faiss.IDSelectorBatch(unit_ids), k)
+
+            distances, indices = segment.index.search(q_emb, k, params=params)
+            if rerank:
+                found = indices[0][indices[0] >= 0]
+                distances, indices = exact_rerank(
+                    q_emb[0], found, segment.vectors_for(found), top_k
+                )
+                distances, indices = distances[None, :], indices[None, :]
+            hits.extend(
+                (float(d), int(idx), segment)
+                for d, idx in zip(distances[0], indices[0])
+                if idx >= 0
+            )
+
+        hits.sort(key=lambda h: h[0])
+        return [
+            segment.record(segment.position_of(chunk_id))
+            for _, chunk_id, segment in hits[:top_k]
+        ]
 
 
 # ---------- SINGLETON ----------
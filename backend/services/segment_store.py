@@ -0,0 +1,848 @@
+"""
+Segment Store
+Append-only, crash-safe persistence for RAG chunks and their vectors.
+
+Every ingest writes one immutable segment (chunk metadata, chunk text,
+vectors and a FAISS index over them) and then commits it by atomically replacing a small JSON manifest.
+Readers only ever see segments listed in the manifest, so a crash part-way
+through a write leaves the previous state intact. Compaction merges segments
+in the background and commits the merged result the same way.
+
+Each segment holds the chunks of a single subject (recorded as its
+subject_id), so a subject's segments form a shard that readers can load on
+its own. Compaction merges per subject. Stores written before sharding hold
+mixed segments; compacting them splits those up.
+
+Deleting a document records a tombstone (its document_id) in the manifest.
+Readers hide tombstoned chunks at once; compaction drops them from disk.
+Tombstones are kept, so chunks a late ingest appends for a deleted document
+stay hidden too.
+"""
+
+import contextlib
+import copy
+import fcntl
+import json
+import math
+import mmap
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from backend.services.index_factory import build_index, index_kind, index_spec, is_exact
+from backend.services.lexical_index import LexicalIndex
+from backend.services.unit_digest import extract_digest
+
+# ---------------- CONFIG ----------------
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".store.lock"
+
+# Size-tiered compaction: segments below COMPACT_TIER_BASE chunks share the
+# first tier, and each further tier holds segments COMPACT_TIER_FACTOR times larger
+COMPACT_TIER_BASE = int(os.getenv("RAG_COMPACT_TIER_BASE", 128))
+COMPACT_TIER_FACTOR = float(os.getenv("RAG_COMPACT_TIER_FACTOR", 4))
+# A segment is rewritten on its own once this share of its chunks is deleted
+COMPACT_DEAD_RATIO = float(os.getenv("RAG_COMPACT_DEAD_RATIO", 0.3))
+
+# Index settings of stores written before they were recorded
+LEGACY_INDEX_SPEC = {"index_type": "flat", "vector_storage": "float32", "pca_dim": 0}
+
+# Manifest keys owned by the store; anything else is an index setting
+STRUCTURAL_KEYS = {
+    "version", "generation", "next_segment_id", "next_chunk_id", "segments", "tombstones"
+}
+
+META_DTYPE = np.dtype([
+    ("chunk_id", "<i8"),
+    ("subject_id", "<i8"),
+    ("unit_id", "<i8"),
+    ("document_id", "<i8"),
+    ("has_vector", "?"),
+    ("text_offset", "<i8"),
+    ("text_length", "<i8"),
+])
+
+
+# ---------------- FILE HELPERS ----------------
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, data: bytes):
+    """Write to a temp file, fsync it, then rename it over `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+# np.load parses .npy headers with ast.literal_eval, whose recursion-depth
+# bookkeeping is not thread-safe in CPython 3.11 (SystemError under load)
+_npy_load_lock = threading.Lock()
+
+
+def _load_npy(path: str, mmap_mode: Optional[str] = None) -> np.ndarray:
+    with _npy_load_lock:
+        return np.load(path, mmap_mode=mmap_mode)
+
+
+def _load_npz(path: str) -> Dict[str, np.ndarray]:
+    with _npy_load_lock:
+        with np.load(path) as archive:
+            return {name: archive[name] for name in archive.files}
+
+
+def _atomic_save_npz(path: str, arrays: Dict[str, np.ndarray]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_npy(path: str, array: np.ndarray):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ---------------- LOADED SEGMENT ----------------
+
+class Segment:
+    """
+    One segment as seen by a reader: column metadata, chunk text, the
+    segment's own FAISS index, its BM25 postings and digest sentences
+    (see unit_digest). In shared mode the
+    first three are memory-mapped, so every gunicorn worker reads the same
+    page-cached copy.
+
+    A Segment is not modified after construction; new tombstones give a new
+    view (with_tombstones) sharing the same data, so a thread holding one
+    never sees its unit map change mid-query.
+    """
+
+    def __init__(
+        self,
+        entry: Dict,
+        meta: np.ndarray,
+        text,
+        index,
+        tombstones=(),
+        vectors: Optional[np.ndarray] = None,
+        index_bytes: Optional[int] = None,
+        lexical: Optional[LexicalIndex] = None,
+        digest: Optional[List[Dict]] = None
+    ):
+        self.entry = entry
+        self.id = entry["id"]
+        self.meta = meta
+        self.text = text
+        self.index = index
+        # Float32 vectors (memory-mapped) for re-ranking a lossy index
+        self.vectors = vectors
+        self._vector_rows = None
+        self.index_bytes = index_bytes
+        self.lexical = lexical
+        self.digest = digest
+        self._apply_tombstones(frozenset(tombstones))
+
+    def with_tombstones(self, tombstones) -> "Segment":
+        """A view of this segment with `tombstones` applied, sharing its data."""
+        view = copy.copy(self)
+        view._apply_tombstones(frozenset(tombstones))
+        return view
+
+    def _apply_tombstones(self, tombstones: frozenset):
+        """Build the unit map without chunks of deleted documents."""
+        self.tombstones = tombstones
+        meta = self.meta
+        alive = np.ones(len(meta), dtype=bool)
+        if len(tombstones) and len(meta):
+            alive = ~np.isin(meta["document_id"], np.fromiter(tombstones, dtype="int64"))
+
+        # (subject_id, unit_id) -> live local positions, metadata is sorted by chunk_id
+        units: Dict[Tuple[int, int], np.ndarray] = {}
+        positions = np.flatnonzero(alive)
+        if len(positions):
+            keys = np.stack([meta["subject_id"][positions], meta["unit_id"][positions]], axis=1)
+            uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            for i, (subject_id, unit_id) in enumerate(uniq.tolist()):
+                units[(subject_id, unit_id)] = positions[inverse == i]
+
+        self.units = units
+        self.dead_count = len(meta) - len(positions)
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    @property
+    def nbytes(self) -> int:
+        """Metadata, text, vectors, postings and digest held for this segment."""
+        index_bytes = self.index_bytes
+        if index_bytes is None:
+            index_bytes = self.index.ntotal * self.index.d * 4 if self.index is not None else 0
+        lexical_bytes = self.lexical.nbytes if self.lexical is not None else 0
+        digest_bytes = sum(len(item["text"]) for item in self.digest or ())
+        return self.meta.nbytes + len(self.text) + index_bytes + lexical_bytes + digest_bytes
+
+    def texts(self) -> List[str]:
+        return [self.record(pos)["text"] for pos in range(len(self))]
+
+    def digest_items(self) -> List[Dict]:
+        """Digest sentences; extracted from the text for segments written without them."""
+        if self.digest is None:
+            self.digest = extract_digest(self.record(pos) for pos in range(len(self)))
+        return self.digest
+
+    def lexical_index(self) -> LexicalIndex:
+        """BM25 postings; built from the text for segments written without them."""
+        if self.lexical is None:
+            self.lexical = LexicalIndex.build(self.texts())
+        return self.lexical
+
+    def record(self, pos: int) -> Dict:
+        m = self.meta[pos]
+        start = int(m["text_offset"])
+        return {
+            "chunk_id": int(m["chunk_id"]),
+            "subject_id": int(m["subject_id"]),
+            "unit_id": int(m["unit_id"]),
+            "document_id": int(m["document_id"]),
+            "text": bytes(self.text[start:start + int(m["text_length"])]).decode("utf-8"),
+        }
+
+    def position_of(self, chunk_id: int) -> int:
+        return int(np.searchsorted(self.meta["chunk_id"], chunk_id))
+
+    def vectors_for(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Float32 vectors of `chunk_ids` (all flagged has_vector)."""
+        if self._vector_rows is None:
+            self._vector_rows = np.cumsum(self.meta["has_vector"]) - 1
+        positions = np.searchsorted(self.meta["chunk_id"], chunk_ids)
+        return np.asarray(self.vectors[self._vector_rows[positions]], dtype="float32")
+
+
+def build_segment(
+    records: List[Dict],
+    vectors: Optional[np.ndarray],
+    dim: int,
+    spec: Optional[Dict] = None
+) -> Tuple[np.ndarray, bytes, np.ndarray, Optional["faiss.Index"]]:
+    """
+    Lay records out as a segment: (meta, text, vectors, index).
+
+    Records are sorted by chunk_id so readers can resolve ids with a binary
+    search. `vectors` holds one row per record flagged `has_vector`. `spec`
+    holds the index settings (see index_factory); the default is exact flat.
+    """
+    if vectors is None or len(vectors) == 0:
+        vectors = np.zeros((0, dim), dtype="float32")
+    vectors = np.asarray(vectors, dtype="float32")
+
+    flagged = [i for i, r in enumerate(records) if r.get("has_vector")]
+    row_of = {rec_i: row for row, rec_i in enumerate(flagged)}
+    order = sorted(range(len(records)), key=lambda i: records[i]["chunk_id"])
+
+    meta = np.zeros(len(records), dtype=META_DTYPE)
+    blobs = []
+    rows = []
+    offset = 0
+    for pos, i in enumerate(order):
+        r = records[i]
+        blob = r["text"].encode("utf-8")
+        blobs.append(blob)
+        meta[pos] = (
+            r["chunk_id"], r["subject_id"], r["unit_id"], r["document_id"],
+            i in row_of, offset, len(blob)
+        )
+        offset += len(blob)
+        if i in row_of:
+            rows.append(row_of[i])
+
+    vectors = np.ascontiguousarray(vectors[rows]) if rows else vectors[:0]
+
+    index = None
+    if len(vectors):
+        index = build_index(
+            vectors, meta["chunk_id"][meta["has_vector"]], dim, **(spec or LEGACY_INDEX_SPEC)
+        )
+
+    return meta, b"".join(blobs), vectors, index
+
+
+def _split_by_subject(
+    records: List[Dict],
+    vectors: Optional[np.ndarray]
+) -> Dict[int, Tuple[List[Dict], Optional[np.ndarray]]]:
+    """Group read_segment()-style output by subject, keeping vectors aligned."""
+    groups: Dict[int, Tuple[List[Dict], List[int]]] = {}
+    row = 0
+    for r in records:
+        group = groups.setdefault(r["subject_id"], ([], []))
+        group[0].append(r)
+        if r.get("has_vector"):
+            group[1].append(row)
+            row += 1
+    return {
+        subject_id: (group_records, vectors[rows] if rows else None)
+        for subject_id, (group_records, rows) in groups.items()
+    }
+
+
+def size_tier(count: int) -> int:
+    """Compaction tier of a segment of `count` chunks."""
+    if count < COMPACT_TIER_BASE:
+        return 0
+    return 1 + int(math.log(count / COMPACT_TIER_BASE, COMPACT_TIER_FACTOR))
+
+
+def tier_full(entries: List[Dict], min_segments: int) -> bool:
+    """Whether a subject's segments hold a size tier of `min_segments` or more."""
+    tiers: Dict[int, int] = {}
+    for entry in entries:
+        tier = size_tier(entry["count"])
+        tiers[tier] = tiers.get(tier, 0) + 1
+    return max(tiers.values(), default=0) >= min_segments
+
+
+def _drop_documents(
+    records: List[Dict],
+    vectors: np.ndarray,
+    documents: set
+) -> Tuple[List[Dict], np.ndarray]:
+    """Filter read_segment() output, keeping vectors aligned with records."""
+    alive = np.array([r["document_id"] not in documents for r in records], dtype=bool)
+    has_vector = np.array([r["has_vector"] for r in records], dtype=bool)
+    kept = [r for r, keep in zip(records, alive) if keep]
+    return kept, vectors[alive[has_vector]] if len(vectors) else vectors
+
+
+# ---------------- SEGMENT STORE ----------------
+
+class SegmentStore:
+    def __init__(self, root: str, dim: int):
+        self.root = root
+        self.dim = dim
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- LOCKING ----------
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialise manifest updates across threads and gunicorn workers."""
+        with self._lock:
+            with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---------- MANIFEST ----------
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def read_manifest(self) -> Dict:
+        if not self.exists():
+            return {
+                "version": 1,
+                "generation": 0,
+                "next_segment_id": 0,
+                "next_chunk_id": 0,
+                "segments": [],
+                "tombstones": []
+            }
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def index_spec(manifest: Dict) -> Dict:
+        """
+        Index settings new segments are built with: as recorded, else the
+        configured ones for a new store, else the legacy exact flat index.
+        """
+        default = LEGACY_INDEX_SPEC if manifest["segments"] else index_spec()
+        return {key: manifest.get(key, default[key]) for key in LEGACY_INDEX_SPEC}
+
+    def _write_manifest(self, manifest: Dict, bump: bool = True):
+        """Commit the manifest; `bump` marks a change readers must pick up."""
+        if bump:
+            manifest["generation"] = manifest.get("generation", 0) + 1
+        atomic_write(
+            self.manifest_path,
+            json.dumps(manifest, indent=1).encode("utf-8")
+        )
+
+    # ---------- SEGMENT FILES ----------
+
+    def _paths(self, segment_id: int) -> Dict[str, str]:
+        base = os.path.join(self.root, f"seg_{segment_id:06d}")
+        return {
+            "meta": f"{base}.meta.npy",
+            "text": f"{base}.text.bin",
+            "vectors": f"{base}.vec.npy",
+            "index": f"{base}.faiss",
+            "lexical": f"{base}.bm25.npz",
+            "digest": f"{base}.digest.json",
+        }
+
+    def _write_segment_files(
+        self,
+        segment_id: int,
+        records: List[Dict],
+        vectors: Optional[np.ndarray],
+        spec: Optional[Dict] = None
+    ) -> Dict:
+        paths = self._paths(segment_id)
+        meta, text, vectors, index = build_segment(records, vectors, self.dim, spec)
+        chunks = [
+            {
+                "chunk_id": m["chunk_id"],
+                "document_id": m["document_id"],
+                "unit_id": m["unit_id"],
+                "text": text[int(m["text_offset"]):int(m["text_offset"]) + int(m["text_length"])].decode("utf-8")
+            }
+            for m in meta
+        ]
+        lexical = LexicalIndex.build([c["text"] for c in chunks])
+
+        # Text, vectors and indexes first; the meta file marks the segment complete
+        atomic_write(paths["text"], text)
+        _atomic_save_npz(paths["lexical"], lexical.arrays())
+        atomic_write(paths["digest"], json.dumps(extract_digest(chunks)).encode("utf-8"))
+        _atomic_save_npy(paths["vectors"], vectors)
+        if index is not None:
+            faiss.write_index(index, f"{paths['index']}.tmp")
+            os.replace(f"{paths['index']}.tmp", paths["index"])
+        _atomic_save_npy(paths["meta"], meta)
+
+        subjects = {int(r["subject_id"]) for r in records}
+        return {
+            "id": segment_id,
+            "subject_id": subjects.pop() if len(subjects) == 1 else None,
+            "count": len(records),
+            "vector_count": int(meta["has_vector"].sum()),
+            "index_type": index_kind(index) if index is not None else "flat",
+            "exact": is_exact(index) if index is not None else True,
+            "bytes": sum(
+                os.path.getsize(p) for p in paths.values() if os.path.exists(p)
+            ),
+        }
+
+    def open_segment(self, entry: Dict, shared: bool = False, tombstones=()) -> Segment:
+        """
+        Load a committed segment. With `shared`, metadata and text are
+        memory-mapped and the FAISS index is opened with IO_FLAG_MMAP_IFC,
+        so the vectors stay in the page cache instead of private memory.
+        Chunks of documents in `tombstones` are hidden from the unit map.
+        """
+        paths = self._paths(entry["id"])
+
+        if shared:
+            meta = _load_npy(paths["meta"], mmap_mode="r")
+            text = b""
+            if os.path.getsize(paths["text"]) > 0:
+                with open(paths["text"], "rb") as f:
+                    text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            meta = _load_npy(paths["meta"])
+            with open(paths["text"], "rb") as f:
+                text = f.read()
+
+        index = vectors = index_bytes = None
+        if entry["vector_count"] > 0:
+            flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if shared else 0
+            index = faiss.read_index(paths["index"], flags)
+            index_bytes = os.path.getsize(paths["index"])
+            if not entry.get("exact", True):
+                # Only the re-ranked candidates' rows are ever paged in
+                vectors = _load_npy(paths["vectors"], mmap_mode="r")
+
+        lexical = digest = None
+        if os.path.exists(paths["lexical"]):
+            lexical = LexicalIndex(**_load_npz(paths["lexical"]))
+        if os.path.exists(paths["digest"]):
+            with open(paths["digest"], "r", encoding="utf-8") as f:
+                digest = json.load(f)
+
+        return Segment(
+            entry, meta, text, index, tombstones, vectors, index_bytes, lexical, digest
+        )
+
+    def read_segment(self, entry: Dict) -> Tuple[List[Dict], np.ndarray]:
+        """Return (records, vectors) for a manifest entry, flagging has_vector."""
+        segment = self.open_segment(entry)
+        vectors = _load_npy(self._paths(entry["id"])["vectors"])
+
+        records = []
+        for pos in range(len(segment)):
+            record = segment.record(pos)
+            record["has_vector"] = bool(segment.meta[pos]["has_vector"])
+            records.append(record)
+        return records, vectors
+
+    def _delete_segment_files(self, segment_id: int):
+        for path in self._paths(segment_id).values():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    def _reserve_segment_ids(self, count: int) -> int:
+        """Allocate `count` consecutive segment ids; returns the first."""
+        with self._locked():
+            manifest = self.read_manifest()
+            first_id = manifest["next_segment_id"]
+            manifest["next_segment_id"] = first_id + count
+            self._write_manifest(manifest, bump=False)
+        return first_id
+
+    def _write_sharded(
+        self,
+        records: List[Dict],
+        vectors: Optional[np.ndarray],
+        spec: Dict
+    ) -> List[Dict]:
+        """Write `records` (flagged has_vector) as one new segment per subject."""
+        groups = _split_by_subject(records, vectors)
+        first_id = self._reserve_segment_ids(len(groups))
+        return [
+            self._write_segment_files(first_id + offset, group_records, group_vectors, spec)
+            for offset, (group_records, group_vectors) in enumerate(
+                groups[subject_id] for subject_id in sorted(groups)
+            )
+        ]
+
+    def count_chunks(self, document_id: int) -> int:
+        """Chunks of a document across all committed segments, read from disk."""
+        total = 0
+        for entry in self.read_manifest()["segments"]:
+            meta = _load_npy(self._paths(entry["id"])["meta"], mmap_mode="r")
+            total += int(np.count_nonzero(meta["document_id"] == document_id)) if len(meta) else 0
+        return total
+
+    # ---------- APPEND ----------
+
+    def append_segment(
+        self,
+        records: List[Dict],
+        vectors: Optional[np.ndarray] = None,
+        settings: Optional[Dict] = None
+    ) -> Tuple[Dict, List[Dict]]:
+        """
+        Persist `records` as a new segment and commit it to the manifest.
+
+        Records without a chunk_id get one allocated here, under the store
+        lock, so concurrent workers never hand out the same id. `vectors`
+        holds one row per record flagged `has_vector`; records without the
+        flag are flagged when vectors are given at all. `settings` are
+        recorded in the manifest unless already set.
+        """
+        with self._locked():
+            manifest = self.read_manifest()
+            entry, stored = self._append_locked(manifest, records, vectors, settings)
+            self._write_manifest(manifest)
+
+        for r in stored:
+            r.pop("has_vector")
+        return entry, stored
+
+    def _append_locked(
+        self,
+        manifest: Dict,
+        records: List[Dict],
+        vectors: Optional[np.ndarray] = None,
+        settings: Optional[Dict] = None
+    ) -> Tuple[Dict, List[Dict]]:
+        """
+        append_segment() for a caller already holding the store lock: writes
+        the segment files and adds the entry to `manifest`, which the caller
+        commits (so several segments can share one manifest write).
+        """
+        has_vectors = vectors is not None and len(vectors) > 0
+
+        next_chunk_id = manifest["next_chunk_id"]
+        stored = []
+        for r in records:
+            r = dict(r)
+            r.setdefault("has_vector", has_vectors)
+            if r.get("chunk_id") is None:
+                r["chunk_id"] = next_chunk_id
+            next_chunk_id = max(next_chunk_id, r["chunk_id"] + 1)
+            stored.append(r)
+
+        segment_id = manifest["next_segment_id"]
+        spec = self.index_spec(manifest)
+        entry = self._write_segment_files(
+            segment_id, stored, vectors if has_vectors else None, spec
+        )
+        entry["sources"] = [segment_id]
+
+        manifest["next_segment_id"] = segment_id + 1
+        manifest["next_chunk_id"] = next_chunk_id
+        manifest["segments"].append(entry)
+        manifest.update(spec)
+        for key, value in (settings or {}).items():
+            manifest.setdefault(key, value)
+        return entry, stored
+
+    # ---------- TOMBSTONES ----------
+
+    def add_tombstones(self, document_ids: List[int]) -> Dict:
+        """Mark documents deleted; returns the committed manifest."""
+        with self._locked():
+            manifest = self.read_manifest()
+            tombstones = set(manifest.get("tombstones", []))
+            tombstones.update(int(d) for d in document_ids)
+            manifest["tombstones"] = sorted(tombstones)
+            self._write_manifest(manifest)
+        return manifest
+
+    def release_tombstone(self, document_id: int) -> bool:
+        """
+        Lift a document's tombstone so its id can tag new chunks. Refused
+        (False) while any committed segment still holds chunks of it.
+        """
+        with self._locked():
+            manifest = self.read_manifest()
+            tombstones = set(manifest.get("tombstones", []))
+            if document_id not in tombstones:
+                return True
+            for entry in manifest["segments"]:
+                meta = _load_npy(self._paths(entry["id"])["meta"], mmap_mode="r")
+                if len(meta) and (meta["document_id"] == document_id).any():
+                    return False
+            manifest["tombstones"] = sorted(tombstones - {document_id})
+            self._write_manifest(manifest)
+        return True
+
+    def _dead_count(self, entry: Dict, tombstones: set) -> int:
+        meta = _load_npy(self._paths(entry["id"])["meta"], mmap_mode="r")
+        if not len(meta) or not tombstones:
+            return 0
+        return int(np.count_nonzero(
+            np.isin(meta["document_id"], np.fromiter(tombstones, dtype="int64"))
+        ))
+
+    def _has_dead(self, entry: Dict, tombstones: set) -> bool:
+        return self._dead_count(entry, tombstones) > 0
+
+    def _tiered(self, entries: List[Dict], tombstones: set, min_segments: int) -> List[Dict]:
+        """
+        The segments of one subject a size-tiered compaction merges: every
+        size tier holding at least `min_segments` segments, plus any segment
+        with COMPACT_DEAD_RATIO or more of its chunks deleted. A large base
+        segment is thus only rewritten once enough segments of its own size
+        pile up, or once much of it is dead.
+        """
+        tiers: Dict[int, List[Dict]] = {}
+        selected = []
+        for entry in entries:
+            if entry["count"] and self._dead_count(entry, tombstones) >= COMPACT_DEAD_RATIO * entry["count"]:
+                selected.append(entry)
+            else:
+                tiers.setdefault(size_tier(entry["count"]), []).append(entry)
+        for tier in tiers.values():
+            if len(tier) >= min_segments:
+                selected.extend(tier)
+        # Rewriting one healthy segment on its own reclaims nothing
+        return selected if len(selected) >= 2 or any(
+            self._has_dead(e, tombstones) for e in selected
+        ) else []
+
+    # ---------- COMPACTION ----------
+
+    def compact(self, force: bool = False, drop_documents=(), min_segments: int = 0) -> List[Dict]:
+        """
+        Merge each subject's segments into one, dropping tombstoned chunks
+        and those of `drop_documents`. Returns the new manifest entries.
+
+        Without `force` only subjects with at least two segments are merged;
+        with it, a single segment holding dead chunks is rewritten as well.
+        With `min_segments`, merging is size-tiered instead: per subject,
+        only segments of similar size are merged, once `min_segments` of
+        them have accumulated (see _tiered()), so the cost of a background
+        compaction stays proportional to the recently ingested data.
+        Mixed segments from before sharding are always split up, with every
+        other segment merged alongside them.
+        Segment files are immutable, so merging happens outside the lock;
+        only reserving segment ids and swapping the manifest entries are
+        serialised. Segments appended meanwhile are kept as they are.
+        """
+        with self._locked():
+            manifest = self.read_manifest()
+            tombstones = set(manifest.get("tombstones", [])) | set(drop_documents)
+            by_subject: Dict[Optional[int], List[Dict]] = {}
+            for entry in manifest["segments"]:
+                by_subject.setdefault(entry.get("subject_id"), []).append(entry)
+
+            if None in by_subject:
+                merged = list(manifest["segments"])
+            elif min_segments:
+                merged = [
+                    entry
+                    for entries in by_subject.values()
+                    for entry in self._tiered(entries, tombstones, min_segments)
+                ]
+            else:
+                merged = [
+                    entry
+                    for entries in by_subject.values()
+                    if len(entries) >= 2 or (
+                        force and tombstones
+                        and any(self._has_dead(e, tombstones) for e in entries)
+                    )
+                    for entry in entries
+                ]
+            if not merged:
+                return []
+            spec = self.index_spec(manifest)
+
+        records, vector_blocks = [], []
+        dropped = 0
+        for entry in merged:
+            seg_records, seg_vectors = _drop_documents(*self.read_segment(entry), tombstones)
+            records.extend(seg_records)
+            dropped += entry["count"] - len(seg_records)
+            if len(seg_vectors):
+                vector_blocks.append(seg_vectors)
+
+        vectors = np.vstack(vector_blocks) if vector_blocks else None
+        new_entries = self._write_sharded(records, vectors, spec)
+        for new_entry in new_entries:
+            # Mixed segments are a source of every shard they are split into
+            new_entry["sources"] = sorted(
+                s for entry in merged
+                if entry.get("subject_id") in (new_entry["subject_id"], None)
+                for s in entry.get("sources", [entry["id"]])
+            )
+
+        merged_ids = {entry["id"] for entry in merged}
+        with self._locked():
+            manifest = self.read_manifest()
+            if not merged_ids <= {e["id"] for e in manifest["segments"]}:
+                # Another worker compacted these segments first
+                for new_entry in new_entries:
+                    self._delete_segment_files(new_entry["id"])
+                return []
+            manifest["segments"] = new_entries + [
+                e for e in manifest["segments"] if e["id"] not in merged_ids
+            ]
+            self._write_manifest(manifest)
+
+        for segment_id in merged_ids:
+            self._delete_segment_files(segment_id)
+
+        reclaimed = sum(e["bytes"] for e in merged) - sum(e["bytes"] for e in new_entries)
+        print(
+            f"🗜️ Compacted {len(merged)} segments into {len(new_entries)} subject shards "
+            f"({dropped} deleted chunks dropped, {reclaimed} bytes reclaimed)"
+        )
+        return new_entries
+
+    # ---------- REBUILD ----------
+
+    def adopt(self, source: "SegmentStore", rebuilt_documents, carry_from: int, revived=()) -> Dict:
+        """
+        Replace this store's contents with `source` (a rebuilt side store).
+
+        Source segments are rewritten under freshly reserved segment and
+        chunk ids, then committed with one manifest write, so readers switch
+        from the old index to the new one atomically. Only live chunks
+        appended since the rebuild started (chunk ids from `carry_from`, the
+        live next_chunk_id at that point) are carried over, when both sides
+        use the same embedding backend; older chunks the rebuild did not
+        reproduce (orphans of deleted documents) are dropped. Index settings
+        recorded by the source replace this store's. Tombstones of `revived`
+        documents (ids a new upload reused before it was rebuilt) are lifted;
+        their old chunks are dropped like every rebuilt document's.
+        """
+        side = source.read_manifest()
+        rebuilt = {int(d) for d in rebuilt_documents}
+        spec = self.index_spec(side)
+
+        with self._locked():
+            manifest = self.read_manifest()
+            replaced = list(manifest["segments"])
+            drop = rebuilt | set(manifest.get("tombstones", []))
+            same_backend = manifest.get("embedding_backend") in (
+                None, side.get("embedding_backend")
+            )
+            base = manifest["next_chunk_id"]
+            manifest["next_chunk_id"] = base + side["next_chunk_id"]
+            self._write_manifest(manifest, bump=False)
+
+        first_id = self._reserve_segment_ids(len(side["segments"]))
+        entries = []
+        for offset, side_entry in enumerate(side["segments"]):
+            records, vectors = source.read_segment(side_entry)
+            for r in records:
+                r["chunk_id"] += base
+            entries.append(self._write_segment_files(
+                first_id + offset, records, vectors, spec
+            ))
+
+        carried, carried_vectors = [], []
+        for entry in replaced:
+            records, vectors = _drop_documents(*self.read_segment(entry), drop)
+            new = np.array([r["chunk_id"] >= carry_from for r in records], dtype=bool)
+            has_vector = np.array([r["has_vector"] for r in records], dtype=bool)
+            carried.extend(r for r, keep in zip(records, new) if keep)
+            if len(vectors) and new.any():
+                carried_vectors.append(vectors[new[has_vector]])
+        if carried and not same_backend:
+            print(
+                f"⚠️ {len(carried)} chunks uploaded during the rebuild use the old "
+                "embedding backend and were dropped; re-upload their documents"
+            )
+            carried, carried_vectors = [], []
+        if carried:
+            entries.extend(self._write_sharded(
+                carried,
+                np.vstack(carried_vectors) if carried_vectors else None,
+                spec
+            ))
+        for entry in entries:
+            entry["sources"] = [entry["id"]]
+
+        replaced_sources = {s for e in replaced for s in e.get("sources", [e["id"]])}
+        with self._locked():
+            manifest = self.read_manifest()
+            kept, dropped = [], []
+            for e in manifest["segments"]:
+                covered = set(e.get("sources", [e["id"]])) <= replaced_sources
+                (dropped if covered else kept).append(e)
+
+            manifest["segments"] = entries + kept
+            manifest["tombstones"] = sorted(
+                set(manifest.get("tombstones", [])) - ({int(d) for d in revived} & rebuilt)
+            )
+            for key, value in side.items():
+                if key not in STRUCTURAL_KEYS:
+                    manifest[key] = value
+            self._write_manifest(manifest)
+
+        for e in dropped:
+            self._delete_segment_files(e["id"])
+
+        if carried:
+            print(f"ℹ️ Carried over {len(carried)} chunks uploaded during the rebuild")
+        return manifest
@@ -0,0 +1,116 @@
+"""
+Shard Cache
+In-process LRU of per-subject index shards, bounded by a memory budget.
+
+A shard is the list of loaded segments of one subject. Shards are loaded on
+first use; when the loaded shards exceed the budget, the least recently used
+ones are dropped (retrievals still holding one keep it alive until they
+finish). Hits, misses, evictions and load times are counted for /admin.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# ---------------- CONFIG ----------------
+
+# Loaded shards above this are evicted, least recently used first
+SHARD_MEMORY_MB = int(os.getenv("RAG_SHARD_MEMORY_MB", 1024))
+
+
+def shard_bytes(segments) -> int:
+    return sum(s.nbytes for s in segments)
+
+
+class ShardCache:
+    def __init__(self, budget_bytes: int = SHARD_MEMORY_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._shards: "OrderedDict[int, List]" = OrderedDict()
+        self._bytes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self.max_load_seconds = 0.0
+
+    # ---------- LOOKUP ----------
+
+    def get(self, subject_id: int) -> Optional[List]:
+        """The shard, marked most recently used; counts a hit or a miss."""
+        with self._lock:
+            segments = self._shards.get(subject_id)
+            if segments is None:
+                self.misses += 1
+                return None
+            self._shards.move_to_end(subject_id)
+            self.hits += 1
+            return segments
+
+    def peek(self, subject_id: int) -> Optional[List]:
+        """The shard if loaded, without touching recency or counters."""
+        with self._lock:
+            return self._shards.get(subject_id)
+
+    def items(self):
+        with self._lock:
+            return list(self._shards.items())
+
+    # ---------- UPDATE ----------
+
+    def put(self, subject_id: int, segments: List, load_seconds: Optional[float] = None):
+        """
+        Store (or replace) a shard and evict cold ones over budget. Pass
+        `load_seconds` when the shard was just read from disk.
+        """
+        size = shard_bytes(segments)
+        with self._lock:
+            if load_seconds is not None:
+                self.loads += 1
+                self.load_seconds += load_seconds
+                self.max_load_seconds = max(self.max_load_seconds, load_seconds)
+
+            self._shards[subject_id] = segments
+            self._shards.move_to_end(subject_id)
+            self._bytes[subject_id] = size
+
+            # The shard just stored stays, even if it alone exceeds the budget
+            while sum(self._bytes.values()) > self.budget_bytes and len(self._shards) > 1:
+                evicted, _ = self._shards.popitem(last=False)
+                del self._bytes[evicted]
+                self.evictions += 1
+                print(f"♻️ Shard for subject {evicted} evicted")
+
+    def discard(self, subject_id: int):
+        with self._lock:
+            self._shards.pop(subject_id, None)
+            self._bytes.pop(subject_id, None)
+
+    # ---------- METRICS ----------
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "budget_bytes": self.budget_bytes,
+                "used_bytes": sum(self._bytes.values()),
+                "loaded_shards": [
+                    {
+                        "subject_id": subject_id,
+                        "segments": len(segments),
+                        "bytes": self._bytes[subject_id]
+                    }
+                    for subject_id, segments in reversed(self._shards.items())
+                ],
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "load_seconds_total": round(self.load_seconds, 4),
+                "load_seconds_avg": round(self.load_seconds / self.loads, 4) if self.loads else None,
+                "load_seconds_max": round(self.max_load_seconds, 4)
+            }
@@ -0,0 +1,175 @@
+"""
+Text Pipeline
+Page-wise PDF text extraction and incremental chunking for streaming ingest.
+
+PyPDF2 extraction is pure Python and CPU-bound, so larger PDFs are split into
+page ranges that a process pool parses in parallel; ranges are yielded back
+in page order as soon as each one (and all before it) is done. Only a few
+ranges per worker are in flight at a time, so parsed text never runs far
+ahead of the chunker and embedder consuming it. Workers are started from a
+fork server (spawned where that is unavailable), never forked directly from
+the multi-threaded web process.
+"""
+
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List
+
+from PyPDF2 import PdfReader
+
+# ---------------- CONFIG ----------------
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Processes used to parse one PDF; 1 keeps extraction in the calling process
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+# Pages handed to a worker per task
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+# Page ranges submitted ahead of the consumer, per worker
+PDF_TASKS_AHEAD = int(os.getenv("PDF_TASKS_AHEAD", 2))
+
+NON_SPACE = re.compile(r"\S")
+
+
+# ---------------- PAGES ----------------
+
+def count_pdf_pages(file_path: str) -> int:
+    try:
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return 0
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Worker: parse pages [start, stop) of one PDF."""
+    reader = PdfReader(file_path)
+    texts = []
+    for i in range(start, stop):
+        page_text = reader.pages[i].extract_text()
+        if page_text:
+            texts.append(page_text + "\n")
+    return texts
+
+
+def _mp_context():
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Workers only need this module (takes effect when the server starts)
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def iter_pdf_pages(file_path: str, workers: int = PDF_EXTRACT_WORKERS) -> Iterator[str]:
+    """Yield each page's text (newline-terminated) in page order."""
+    try:
+        reader = PdfReader(file_path)
+        page_count = len(reader.pages)
+
+        if workers <= 1 or page_count <= PDF_PAGES_PER_TASK:
+            for page in reader.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    yield page_text + "\n"
+            return
+
+        ranges = iter([
+            (start, min(page_count, start + PDF_PAGES_PER_TASK))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ])
+        workers = min(workers, -(-page_count // PDF_PAGES_PER_TASK))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context()) as pool:
+            futures = deque(
+                pool.submit(_extract_page_range, file_path, start, stop)
+                for start, stop in islice(ranges, PDF_TASKS_AHEAD * workers)
+            )
+            try:
+                while futures:
+                    texts = futures.popleft().result()
+                    # Keep the workers busy while the consumer takes these pages
+                    for start, stop in islice(ranges, 1):
+                        futures.append(pool.submit(_extract_page_range, file_path, start, stop))
+                    yield from texts
+            finally:
+                for future in futures:
+                    future.cancel()
+    except Exception as e:
+        print("❌ PDF extraction error:", e)
+
+
+# ---------------- CHUNKER ----------------
+
+class StreamingChunker:
+    """
+    Incremental version of the fixed-size chunker: text is fed in pieces
+    (one page at a time) and chunks are emitted as soon as they are final.
+    Feeding a whole document and calling finish() gives the same chunks as
+    chunking it in one go, including the overlap across page boundaries.
+
+    A chunk is final once text exists past its window: only then is it known
+    whether the window may be cut back to the last sentence or line break.
+    """
+
+    def __init__(self, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        self.size = size
+        self.overlap = overlap
+        self.buffer = ""
+        self.start = 0
+        self.started = False
+
+    def feed(self, text: str) -> List[str]:
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return []
+            self.started = True
+        self.buffer += text
+        return self._drain(final=False)
+
+    def finish(self) -> List[str]:
+        self.buffer = self.buffer.rstrip()
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[str]:
+        chunks = []
+        buffer = self.buffer
+        start = self.start
+
+        while start < len(buffer):
+            end = start + self.size
+
+            if end < len(buffer):
+                # Only cut here if non-blank text follows; otherwise this may be the tail
+                if not final and not NON_SPACE.search(buffer, end):
+                    break
+                split_point = max(
+                    buffer.rfind(".", start, end),
+                    buffer.rfind("\n", start, end)
+                )
+                if split_point > start:
+                    end = split_point + 1
+            elif not final:
+                break
+
+            chunk = buffer[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+
+            next_start = end - self.overlap
+            # A sentence break close to the window start must still advance
+            start = next_start if next_start > start else end
+
+        # Drop consumed text so the buffer stays about one page long
+        self.buffer = buffer[start:]
+        self.start = 0
+        return chunks
+
+
+def chunk_text(text: str) -> List[str]:
+    chunker = StreamingChunker()
+    return chunker.feed(text) + chunker.finish()
@@ -0,0 +1,97 @@
+"""
+Unit Digest
+Compact study material per unit: the informative sentences of its chunks,
+deduplicated, with definition-style concept sentences first.
+
+Sentences are extracted when a segment is written and stored next to it
+(seg_XXXXXX.digest.json), so ingestion pays for extraction once. A unit's
+digest is merged from the digests of the segments holding it: appending a
+segment only merges that segment's sentences in, and deleting a document
+drops its sentences, without re-reading any chunk text. Chunk overlap and
+re-uploaded workbooks repeat sentences; dedup keeps the first copy.
+"""
+
+import hashlib
+import re
+from typing import Dict, Iterable, List
+
+from backend.services.concept_filter import is_valid_concept
+
+# ---------------- CONFIG ----------------
+
+MIN_SENTENCE_CHARS = 40
+MAX_SENTENCE_CHARS = 600
+# Share of letters a sentence needs (drops tables, page furniture, numbering)
+MIN_ALPHA_RATIO = 0.5
+
+CONCEPT = 2
+STATEMENT = 1
+
+# Sentence ends, and numbered workbook questions ("12. Which ...")
+SENTENCE_BREAK = re.compile(r"(?<=[.?!])\s+(?=[A-Z0-9(\"'])|\s+(?=\d{1,3}[.)]\s+[A-Z])")
+# The next question's number left at a sentence end ("... above 15.")
+TRAILING_NUMBER = re.compile(r"\s+\d{1,3}[.)]?$")
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = (TRAILING_NUMBER.sub("", s.strip()) for s in SENTENCE_BREAK.split(" ".join(text.split())))
+    return [s for s in sentences if s]
+
+
+def sentence_key(sentence: str) -> str:
+    normalised = NON_ALNUM.sub(" ", sentence.lower()).strip()
+    return hashlib.blake2b(normalised.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def is_informative(sentence: str) -> bool:
+    if not MIN_SENTENCE_CHARS <= len(sentence) <= MAX_SENTENCE_CHARS:
+        return False
+    # Chunks start mid-sentence; the fragment is complete in the previous chunk
+    if sentence[0].islower():
+        return False
+    letters = sum(c.isalpha() for c in sentence)
+    return letters / len(sentence) >= MIN_ALPHA_RATIO
+
+
+def extract_digest(records: Iterable[Dict]) -> List[Dict]:
+    """Digest sentences of `records` (chunk dicts), deduplicated, in chunk order."""
+    seen = set()
+    items = []
+    for r in records:
+        for sentence in split_sentences(r["text"]):
+            if not is_informative(sentence):
+                continue
+            key = sentence_key(sentence)
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append({
+                "chunk_id": int(r["chunk_id"]),
+                "document_id": int(r["document_id"]),
+                "unit_id": int(r["unit_id"]),
+                "priority": CONCEPT if is_valid_concept(sentence) else STATEMENT,
+                "key": key,
+                "text": sentence
+            })
+    return items
+
+
+def merge_digests(digests: Iterable[List[Dict]], seen=None) -> List[Dict]:
+    """
+    Concatenate digests, skipping sentences already in `seen` (a set of
+    keys, updated in place) or earlier in the input.
+    """
+    seen = set() if seen is None else seen
+    merged = []
+    for items in digests:
+        for item in items:
+            if item["key"] not in seen:
+                seen.add(item["key"])
+                merged.append(item)
+    return merged
+
+
+def ordered(items: List[Dict]) -> List[Dict]:
+    """Concept sentences first, each group in chunk order."""
+    return sorted(items, key=lambda item: (-item["priority"], item["chunk_id"]))
@@ -193,13 +193,18 @@ async function handleFiles(files) {
 
         uploadZone.innerHTML = `<div class="spinner"></div><p>Uploading ${file.name}...</p>`;
 
-        const result = await AdminAPI.uploadDocument(formData);
+        let result = await AdminAPI.uploadDocument(formData);
+
+        if (result.success && result.job) {
+            result = await waitForJob(result.job, file.name);
+        }
 
         if (result.success) {
             uploadZone.innerHTML = `
                 <div style="color: var(--success-color);">\u2713</div>
                 <p>${result.message}</p>
             `;
+            loadDocuments();
             setTimeout(() => {
                 uploadZone.innerHTML = `
                     <div class="upload-icon">\u{1F4C4}</div>
@@ -215,6 +220,29 @@ async function handleFiles(files) {
     }
 }
 
+async function waitForJob(job, fileName) {
+    // Poll the ingestion job until the background worker finishes it
+    while (job.status === 'queued' || job.status === 'running') {
+        const pages = job.total_pages ? `${job.pages_parsed}/${job.total_pages}` : job.pages_parsed;
+        uploadZone.innerHTML = `
+            <div class="spinner"></div>
+            <p>Processing ${fileName} (${job.stage})...</p>
+            <p>${pages} pages parsed, ${job.chunks_embedded}/${job.chunks_created} chunks embedded</p>
+        `;
+
+        await new Promise(resolve => setTimeout(resolve, 1500));
+
+        const result = await AdminAPI.getJob(job.id);
+        if (!result.success) return result;
+        job = result.job;
+    }
+
+    if (job.status === 'done') {
+        return { success: true, message: `Document processed. ${job.chunks_created} chunks created.` };
+    }
+    return { success: false, message: job.error || 'Processing failed' };
+}
+
 async function deleteDocument(docId) {
     if (!confirm('Are you sure you want to delete this document?')) return;
     
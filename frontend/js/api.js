@@ -118,6 +118,62 @@ const QuizAPI = {
             body: JSON.stringify({ subject_id, unit_id, difficulty, mode })
         }),
 
+    // Server-Sent Events over fetch (EventSource cannot send the auth header);
+    // onEvent(name, data) runs for start / question / done / error
+    generateStream: async (subject_id, unit_id, difficulty, onEvent) => {
+        try {
+            const response = await fetch(`${API_BASE}/quiz/generate/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    ...getAuthHeader()
+                },
+                body: JSON.stringify({ subject_id, unit_id, difficulty })
+            });
+
+            if (response.status === 401) {
+                localStorage.removeItem('token');
+                localStorage.removeItem('user');
+                window.location.href = '/';
+            }
+
+            // Errors before the stream starts come back as plain JSON
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.startsWith('text/event-stream')) {
+                return response.json();
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let end;
+                while ((end = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+
+                    let event = 'message';
+                    let data = '';
+                    block.split('\n').forEach((line) => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    onEvent(event, data ? JSON.parse(data) : null);
+                }
+            }
+
+            return { success: true };
+        } catch (error) {
+            console.error('API Error:', error);
+            return { success: false, message: 'Network error. Please try again.' };
+        }
+    },
+
     submit: (attempt_id, answers, time_spent_seconds) =>
         apiRequest('/quiz/submit', {
             method: 'POST',
@@ -171,6 +227,9 @@ const AdminAPI = {
         return response.json();
     },
 
+    getJob: (id) =>
+        apiRequest(`/admin/jobs/${id}`, { method: 'GET' }),
+
     getDocuments: () =>
         apiRequest('/admin/documents', { method: 'GET' }),
 
@@ -1,6 +1,9 @@
 /**
  * Quiz Page JavaScript
  * Handles quiz generation, navigation, submission, and results
+ *
+ * Questions are streamed: the first one is shown as soon as it arrives and
+ * the rest are appended while the student answers.
  */
 
 let quizData = null;
@@ -8,6 +11,8 @@ let currentQuestion = 0;
 let userAnswers = [];
 let startTime = null;
 let attemptId = null;
+let generating = false;
+let expectedTotal = 0;
 
 document.addEventListener("DOMContentLoaded", async function () {
   if (!requireAuth()) return;
@@ -31,34 +36,73 @@ async function generateQuiz(config) {
   loadingEl.classList.remove("hidden");
   quizContentEl.classList.add("hidden");
 
-  const result = await QuizAPI.generate(
+  let errorMessage = null;
+
+  const result = await QuizAPI.generateStream(
     config.subject_id,
     config.unit_id,
     config.difficulty,
-    "quiz"
+    (event, data) => {
+      if (event === "start") {
+        quizData = { ...data, questions: [] };
+        attemptId = data.attempt_id;
+        expectedTotal = data.total;
+        generating = true;
+      } else if (event === "question") {
+        quizData.questions.push(data.question);
+        userAnswers.push(-1);
+
+        if (quizData.questions.length === 1) {
+          startTime = Date.now();
+          loadingEl.classList.add("hidden");
+          quizContentEl.classList.remove("hidden");
+          renderQuestion();
+          updateProgress();
+        } else {
+          refreshQuizState();
+        }
+      } else if (event === "done") {
+        generating = false;
+        refreshQuizState();
+      } else if (event === "error") {
+        generating = false;
+        errorMessage = data.message;
+      }
+    }
   );
 
-  if (result.success && result.questions && result.questions.length > 0) {
-    quizData = result;
-    attemptId = result.attempt_id;
-    userAnswers = new Array(result.questions.length).fill(-1);
-    startTime = Date.now();
-
-    loadingEl.classList.add("hidden");
-    quizContentEl.classList.remove("hidden");
+  // Stream cut short: keep what arrived
+  if (generating) {
+    generating = false;
+    if (quizData && quizData.questions.length > 0) refreshQuizState();
+  }
 
-    renderQuestion();
-    updateProgress();
-  } else {
+  if (!quizData || quizData.questions.length === 0) {
     loadingEl.innerHTML = `
       <div class="alert alert-error">
-        ${result.message || "Failed to generate quiz. Please try again."}
+        ${errorMessage || result.message || "Failed to generate quiz. Please try again."}
       </div>
       <a href="/dashboard" class="btn btn-primary">Back to Dashboard</a>
     `;
   }
 }
 
+function questionCount() {
+  // While streaming, count the questions still on their way
+  return generating
+    ? Math.max(expectedTotal, quizData.questions.length)
+    : quizData.questions.length;
+}
+
+function refreshQuizState() {
+  const numberEl = document.querySelector("#questionCard .question-number");
+  if (numberEl) {
+    numberEl.textContent = `Question ${currentQuestion + 1} of ${questionCount()}`;
+  }
+  updateProgress();
+  updateNavButtons();
+}
+
 function renderQuestion() {
   const question = quizData.questions[currentQuestion];
   const questionCard = document.getElementById("questionCard");
@@ -67,7 +111,7 @@ function renderQuestion() {
 
   questionCard.innerHTML = `
     <div class="question-number">
-      Question ${currentQuestion + 1} of ${quizData.questions.length}
+      Question ${currentQuestion + 1} of ${questionCount()}
     </div>
     <div class="question-text">${question.question}</div>
     <ul class="options-list">
@@ -114,7 +158,7 @@ function updateProgress() {
   const progressBar = document.getElementById("progressBar");
   const progressText = document.getElementById("progressText");
   const answered = userAnswers.filter((a) => a !== -1).length;
-  const total = quizData.questions.length;
+  const total = questionCount();
   const percentage = (answered / total) * 100;
 
   progressBar.style.width = `${percentage}%`;
@@ -127,8 +171,11 @@ function updateNavButtons() {
   const submitBtn = document.getElementById("submitBtn");
 
   prevBtn.disabled = currentQuestion === 0;
+  // The next question may still be generating
+  nextBtn.disabled = currentQuestion >= quizData.questions.length - 1;
+  submitBtn.disabled = generating;
 
-  if (currentQuestion === quizData.questions.length - 1) {
+  if (currentQuestion === questionCount() - 1) {
     nextBtn.classList.add("hidden");
     submitBtn.classList.remove("hidden");
   } else {